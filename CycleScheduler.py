@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 09:12 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/CycleScheduler
+
+@author: Dylan Neff, dn277127
+"""
+
+from collections import deque
+from math import floor, sqrt
+from time import monotonic, sleep
+
+
+class CycleScheduler:
+    def __init__(self, stats_points=100):
+        """
+        Fire watch cycles on a fixed cadence using the monotonic clock. If a cycle overruns one or more ticks, the
+        missed ticks are skipped rather than fired back to back.
+        :param stats_points: Number of recent cycle periods to keep for period and jitter statistics.
+        """
+        self.next_tick = None
+        self.last_start = None
+        self.periods = deque(maxlen=stats_points)  # seconds Achieved time between consecutive cycle starts
+        self.skipped_ticks = 0
+
+    def reset(self):
+        self.next_tick = monotonic()
+        self.last_start = None
+        self.periods.clear()
+        self.skipped_ticks = 0
+
+    def restart(self):
+        """
+        Start the grid again from now, after a wait was cut short to run a cycle early. Keeps the statistics.
+        """
+        self.next_tick = monotonic()
+
+    def wait(self, period, stop_event=None):
+        """
+        Sleep until the next tick of the grid, then record the achieved period.
+        :param period: seconds Target time between cycle starts. May change between calls.
+        :param stop_event: threading.Event which ends the wait early when set.
+        :return:
+        """
+        if self.next_tick is None:
+            self.reset()
+        self.next_tick += period
+        now = monotonic()
+        if now < self.next_tick:
+            if stop_event is None:
+                sleep(self.next_tick - now)
+            elif stop_event.wait(self.next_tick - now):
+                return
+        elif period > 0:  # Overran. Fire now and skip the missed ticks instead of firing them back to back.
+            missed = floor((now - self.next_tick) / period)
+            self.skipped_ticks += missed
+            self.next_tick += missed * period
+        else:
+            self.next_tick = now
+
+        start = monotonic()
+        if self.last_start is not None:
+            self.periods.append(start - self.last_start)
+        self.last_start = start
+
+    def get_period(self):
+        """
+        :return: seconds Mean achieved period over the recent cycles, None if not enough cycles yet.
+        """
+        if len(self.periods) == 0:
+            return None
+        return sum(self.periods) / len(self.periods)
+
+    def get_jitter(self):
+        """
+        :return: seconds Standard deviation of the achieved period over the recent cycles, None if not enough cycles.
+        """
+        if len(self.periods) < 2:
+            return None
+        mean = self.get_period()
+        return sqrt(sum((p - mean) ** 2 for p in self.periods) / (len(self.periods) - 1))
+
+
+class AdaptivePeriod:
+    def __init__(self, min_period=1, idle_period=10, stable_period=None, fast_time=30, stable_time=300,
+                 stable_tolerance=0.1):
+        """
+        Choose the time until the next watch cycle from the run state. Polls at min_period around run starts and
+        stops, after the rate crosses the threshold and while alarms are active, backs off to idle_period when there
+        has been no run for fast_time and the run number is tracked separately, and to stable_period once the rate
+        has been steady for stable_time. Otherwise polls at check_time, so alarm and run start latency is never
+        worse than a fixed check_time unless stable_period is set above it.
+        :param min_period: seconds Fast period. Prometheus scrapes every 2 s, much faster only re-reads the same data.
+        :param idle_period: seconds Period with no run, only while a RunTracker watches for the next run.
+        :param stable_period: seconds Period during a steady run, check_time if None.
+        :param fast_time: seconds Time to stay fast after a run start/stop or threshold crossing.
+        :param stable_time: seconds Time the rate must stay within stable_tolerance to count as steady.
+        :param stable_tolerance: Maximum (max - min) / mean of the rate over stable_time to count as steady.
+        """
+        self.min_period = min_period
+        self.idle_period = idle_period
+        self.stable_period = stable_period
+        self.fast_time = fast_time
+        self.stable_time = stable_time
+        self.stable_tolerance = stable_tolerance
+
+        self.last_run = None
+        self.last_change = None  # Time of the last run start/stop or threshold crossing
+        self.last_low = None  # Rate below threshold at the last cycle
+        self.rates = deque()  # (time, rate) over the last stable_time
+        self.stable = False  # Rate steady over stable_time as of the last update
+
+    def update(self, snapshot, rate_threshold):
+        """
+        Track run transitions, threshold crossings and rate stability from the latest snapshot. Only called from the
+        watcher thread, get_period only reads the results so it's safe from any thread.
+        :param snapshot: WatchSnapshot of the latest cycle.
+        :param rate_threshold: Hz Rate alarm threshold.
+        :return:
+        """
+        now = snapshot.time
+        if snapshot.run_num != self.last_run:
+            self.last_run = snapshot.run_num
+            self.last_change = now
+            self.rates.clear()
+        low = snapshot.rate is not None and snapshot.rate < rate_threshold
+        if self.last_low is not None and low != self.last_low:
+            self.last_change = now
+        self.last_low = low
+
+        if snapshot.rate is None:
+            self.rates.clear()
+        else:
+            self.rates.append((now, snapshot.rate))
+            while self.rates[0][0] < now - self.stable_time:
+                self.rates.popleft()
+        self.stable = self.is_stable()
+
+    def is_stable(self):
+        if len(self.rates) < 2 or self.rates[-1][0] - self.rates[0][0] < self.stable_time * 0.9:
+            return False
+        rates = [rate for t, rate in self.rates]
+        mean = sum(rates) / len(rates)
+        return mean > 0 and (max(rates) - min(rates)) / mean <= self.stable_tolerance
+
+    def get_period(self, snapshot, check_time, run_tracked=False):
+        """
+        :param snapshot: WatchSnapshot of the latest cycle, None if there hasn't been one.
+        :param check_time: seconds Normal period.
+        :param run_tracked: True if a RunTracker polls the run number on its own, so a new run is seen on time
+                            however long the cycle period. Without it there is no idle backoff.
+        :return: seconds Time until the next cycle, and why it was chosen: 'fast', 'idle', 'stable' or 'check_time'.
+        """
+        if snapshot is None:
+            return check_time, 'check_time'
+        last_change = self.last_change
+        recent_change = last_change is not None and snapshot.time - last_change < self.fast_time
+        if snapshot.rate_alert or snapshot.mvtx_alert or recent_change or (self.last_low and snapshot.run_num):
+            return min(self.min_period, check_time), 'fast'
+        if snapshot.run_num is None and run_tracked:
+            return max(self.idle_period, check_time), 'idle'
+        if self.stable:
+            return self.stable_period if self.stable_period is not None else check_time, 'stable'
+        return check_time, 'check_time'
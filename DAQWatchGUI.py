@@ -13,20 +13,22 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import Toplevel, Button, Scrollbar, Text, filedialog, font
 from threading import Thread
+from queue import Queue, Full, Empty
 import json
-from time import strftime, localtime, gmtime, sleep
+from time import strftime, localtime, gmtime, perf_counter, time
+from collections import deque
 
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.dates as mdates
 from datetime import datetime
 
 from DAQWatcher import DAQWatcher
+from RateHistory import RateHistory, MinMaxDecimator
+from SnapshotArchive import read_archive_rates
 
 
 class DAQWatchGUI:
-    def __init__(self, root, local=False):
+    def __init__(self, root, local=False, startup_mark=None, publish_address=None, subscribe_address=None):
         self.root = root
+        self.startup_mark = startup_mark if startup_mark is not None else lambda name: None  # Startup profiling
         self.root.title("DAQ Watch")
         self.root.geometry('900x500')
         if local:
@@ -57,35 +59,99 @@ class DAQWatchGUI:
         self.previous_status_counter = 0
         self.status_refresh_count = 10
 
+        # Watcher thread publishes snapshots here, Tk main loop drains them. Tkinter is not thread-safe.
+        self.snapshot_queue = Queue(maxsize=100)
+        self.drain_period = 100  # ms Time between checks of the snapshot queue
+        self.time_since_period = 10000  # ms Time between updates of the time since last check
+        self.plot_delay = 50  # ms Time after startup to create the plot, so the window is mapped and painted first
+        self.diagnostics_period = 1000  # ms Time between refreshes of the diagnostics window
+        self.last_check = datetime.now()
+        self.last_snapshot = None
+
         self.alarm_sound_file_path = None
         self.run_end_reminder_sound_file_path = None
         self.run_start_sound_file_path = None
         self.mvtx_staves_alarm_sound_file_path = None
 
-        # Create and place widgets
+        # Grafana transport settings, only set via config file
+        self.connect_timeout = 3  # seconds Time to wait for a connection to the Grafana proxy
+        self.read_timeout = 5  # seconds Time to wait for a response once connected
+        self.request_retries = 2  # Number of retries on connection errors or gateway errors
+        self.retry_backoff = 0.3  # seconds Base of exponential backoff between retries
+        self.rate_query_mode = 'range'  # 'range' two point slope of raw samples, 'rate' server-side, 'incremental' local
+        self.batch_queries = False  # Send all per-cycle queries in one /api/ds/query request
+        self.mvtx_incremental = False  # Only fetch MVTX stave rows newer than the last seen
+        self.mvtx_resync_period = 300  # seconds Time between full resyncs of the MVTX stave values
+        self.archive_dir = 'archive'  # Directory to archive every snapshot to, relative to repo. None to disable.
+        self.archive_load_hours = 24  # hours Archived rate history to load into the plot on start
+        self.archive_days = 30  # days Day files to keep in the archive, None to keep all
+        self.backfill_hours = 6  # hours Rate history to fetch from Prometheus on start, where not in the archive
+        self.backfill_step = 5  # seconds Time between backfilled points
+        self.backfill_min_gap = 60  # seconds Gaps between archived points shorter than this aren't backfilled
+        self.metrics_port = None  # Port to serve Prometheus /metrics of the watcher on, None to disable
+        self.publish_address = None  # 'host:port' to share this GUI's readings on for subscribing GUIs, None to disable
+        self.subscribe_address = None  # 'host:port' of a publishing watcher to take readings from instead of polling
+        self.cache_ttls = None  # Dictionary of query name to seconds to cache its responses, None for the defaults
+        self.adaptive_polling = False  # Poll faster around run transitions and alarms, slower with no run
+        self.min_check_time = 1  # seconds Adaptive polling period around run transitions and alarms
+        self.idle_check_time = 10  # seconds Adaptive polling period with no run
+        self.stable_check_time = None  # seconds Adaptive polling period in a steady run, None for check_time
+        self.run_poll_time = None  # seconds Time between run number polls on their own thread, None to disable
+        self.run_start_lookback = 600  # seconds Run number history to search for the run start time
+        self.backfill_queue = Queue()  # Chunks of backfilled (time, rate) points, merged into the plot on the Tk loop
+
+        # Create and place widgets. Rate plot is created once the window is up, matplotlib is slow to import.
         self.create_widgets()
+        self.startup_mark('widgets created')
 
-        # Load saved configuration
+        # Load saved configuration. Addresses given on the command line override the config file.
         self.load_config()
-
-        self.watcher = DAQWatcher(update_callback=self.update_gui, rate_threshold=self.rate_threshold,
+        if publish_address is not None:
+            self.publish_address = publish_address
+        if subscribe_address is not None:
+            self.subscribe_address = subscribe_address
+        self.load_archive_history()
+        self.startup_mark('config and archive loaded')
+
+        self.watcher = DAQWatcher(update_callback=self.publish_snapshot, rate_threshold=self.rate_threshold,
                                   integration_time=self.integration_time, check_time=self.check_time,
                                   target_run_time=self.target_run_time, grafana_url=self.grafana_url,
-                                  new_run_cushion=self.new_run_cushion, rate_alarm_cushion=self.rate_alarm_cushion)
+                                  new_run_cushion=self.new_run_cushion, rate_alarm_cushion=self.rate_alarm_cushion,
+                                  connect_timeout=self.connect_timeout, read_timeout=self.read_timeout,
+                                  request_retries=self.request_retries, retry_backoff=self.retry_backoff,
+                                  rate_query_mode=self.rate_query_mode, batch_queries=self.batch_queries,
+                                  mvtx_incremental=self.mvtx_incremental, mvtx_resync_period=self.mvtx_resync_period,
+                                  archive_dir=self.get_archive_path(), metrics_port=self.metrics_port,
+                                  publish_address=self.publish_address, subscribe_address=self.subscribe_address,
+                                  cache_ttls=self.cache_ttls, adaptive_polling=self.adaptive_polling,
+                                  min_check_time=self.min_check_time, idle_check_time=self.idle_check_time,
+                                  stable_check_time=self.stable_check_time, run_poll_time=self.run_poll_time,
+                                  run_start_lookback=self.run_start_lookback, archive_days=self.archive_days)
         self.watcher_thread = Thread(target=self.start_watcher)
         self.watcher_thread.daemon = True  # Daemonize thread so it stops with the GUI
         self.watcher_thread.name = 'Watcher Thread'
         self.watcher_thread.start()
 
-        self.time_since_thread = Thread(target=self.update_time_since)
-        self.time_since_thread.daemon = True
-        self.time_since_thread.name = 'Time Since Thread'
-        self.time_since_thread.start()
+        self.root.after(self.drain_period, self.drain_snapshots)
+        self.root.after(self.time_since_period, self.update_time_since)
+
+        # Backfill the plot from Prometheus wherever the archive has no points in the last backfill_hours. Subscribers
+        # don't query Grafana at all.
+        backfill_gaps = self.get_backfill_gaps(time() - self.backfill_hours * 3600, time()) \
+            if self.subscribe_address is None else []
+        self.backfill_thread = Thread(target=self.backfill_rate_history, args=(backfill_gaps,))
+        self.backfill_thread.daemon = True
+        self.backfill_thread.name = 'Backfill Thread'
+        self.backfill_thread.start()
 
         self.set_parameters()
         self.set_sound_file_paths()
 
         self.update_param_display()
+        self.startup_mark('watcher started')
+
+        # Not after_idle, which can run before the newly mapped window's Expose events are handled
+        self.root.after(self.plot_delay, self.create_plot)
 
     def start_watcher(self):
         self.watcher.watch_daq()
@@ -204,6 +270,12 @@ class DAQWatchGUI:
                                                      font=('Helvetica', 10, 'bold'), relief=tk.RAISED, bd=2)
         self.sound_control_window_button.pack(side=tk.TOP, pady=2)
 
+        # Diagnostics window button
+        self.diagnostics_button = tk.Button(button_frame, text="Diagnostics", command=self.show_diagnostics,
+                                            bg='lightgrey', fg='black', font=('Helvetica', 10, 'bold'),
+                                            relief=tk.RAISED, bd=2)
+        self.diagnostics_button.pack(side=tk.TOP, pady=2)
+
         output_frame = ttk.Frame(form_button_status_frame)
         output_frame.pack(side=tk.RIGHT, fill=tk.X, padx=10, pady=10)
 
@@ -253,20 +325,41 @@ class DAQWatchGUI:
         self.status_label.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
 
         # Container frame for the graph
-        graph_frame = ttk.Frame(self.root)
-        graph_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.graph_frame = ttk.Frame(self.root)
+        self.graph_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        self.rate_history = RateHistory(self.max_graph_points)  # Times in epoch seconds, rates in kHz
+        self.plot_decimator = MinMaxDecimator()  # Plot only the min and max of each ~2 pixel wide bucket of points
+        self.fig, self.ax, self.canvas = None, None, None  # Created in create_plot
+        self.plot_background = None
+        self.plot_x_headroom = 0.2  # Fraction of the time span to leave empty on the right, so rescale rarely
+        self.blit_update_times = deque(maxlen=100)  # seconds Time of recent blitted plot updates
+        self.full_draw_times = deque(maxlen=100)  # seconds Time of recent full plot redraws
+
+    def create_plot(self):
+        """
+        Import matplotlib and create the rate plot. Called once the rest of the window is up so the status display
+        and first poll aren't held up by it.
+        :return:
+        """
+        self.root.update()  # Paint the status display before the slow import
+        self.startup_mark('window drawn')
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        import matplotlib.dates as mdates
+        self.startup_mark('matplotlib imported')
 
         # Rate plot
         self.fig, self.ax = plt.subplots()
-        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        self.time_data = []
-        self.rate_data = []
-        self.line, = self.ax.plot([], [], 'r-')
-        self.thresh_line = self.ax.axhline(self.rate_threshold / 1000, color='g', linestyle='--')
+        # Line and threshold are animated, drawn by blitting over a cached background of the static plot
+        self.line, = self.ax.plot([], [], 'r-', animated=True)
+        self.thresh_line = self.ax.axhline(self.rate_threshold / 1000, color='g', linestyle='--', animated=True)
+        self.canvas.mpl_connect('draw_event', self.on_plot_draw)
 
-        # Format x-axis as time
-        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        # Format x-axis as local time. Times are plotted as days since the epoch, matplotlib's date units.
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S', tz=datetime.now().astimezone().tzinfo))
 
         # Match the plot background to Tkinter window background
         bg_color = self.root.cget('bg')
@@ -276,6 +369,9 @@ class DAQWatchGUI:
         self.ax.set_ylabel('DAQ Rate (kHz)')
         self.fig.subplots_adjust(left=0.081, right=0.98, top=0.99, bottom=0.1)
 
+        self.draw_rate_history()
+        self.startup_mark('plot created')
+
     def save_config(self):
         config = {
             'rate_threshold': self.rate_entry.get(),
@@ -290,7 +386,30 @@ class DAQWatchGUI:
             'alarm_sound_file': self.alarm_sound_file_path,
             'run_end_reminder_sound_file': self.run_end_reminder_sound_file_path,
             'run_start_sound_file': self.run_start_sound_file_path,
-            'mvtx_staves_alarm_sound_file': self.mvtx_staves_alarm_sound_file_path
+            'mvtx_staves_alarm_sound_file': self.mvtx_staves_alarm_sound_file_path,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'request_retries': self.request_retries,
+            'retry_backoff': self.retry_backoff,
+            'rate_query_mode': self.rate_query_mode,
+            'batch_queries': self.batch_queries,
+            'mvtx_incremental': self.mvtx_incremental,
+            'mvtx_resync_period': self.mvtx_resync_period,
+            'archive_dir': self.archive_dir,
+            'archive_load_hours': self.archive_load_hours,
+            'archive_days': self.archive_days,
+            'backfill_hours': self.backfill_hours,
+            'backfill_step': self.backfill_step,
+            'metrics_port': self.metrics_port,
+            'publish_address': self.publish_address,
+            'subscribe_address': self.subscribe_address,
+            'cache_ttls': self.cache_ttls,
+            'adaptive_polling': self.adaptive_polling,
+            'min_check_time': self.min_check_time,
+            'idle_check_time': self.idle_check_time,
+            'stable_check_time': self.stable_check_time,
+            'run_poll_time': self.run_poll_time,
+            'run_start_lookback': self.run_start_lookback
         }
         with open(self.config_path, 'w') as f:
             json.dump(config, f, indent=4)
@@ -314,11 +433,77 @@ class DAQWatchGUI:
                 self.run_end_reminder_sound_file_path = config.get('run_end_reminder_sound_file', None)
                 self.run_start_sound_file_path = config.get('run_start_sound_file', None)
                 self.mvtx_staves_alarm_sound_file_path = config.get('mvtx_staves_alarm_sound_file', None)
+                self.connect_timeout = float(config.get('connect_timeout', self.connect_timeout))
+                self.read_timeout = float(config.get('read_timeout', self.read_timeout))
+                self.request_retries = int(config.get('request_retries', self.request_retries))
+                self.retry_backoff = float(config.get('retry_backoff', self.retry_backoff))
+                self.rate_query_mode = config.get('rate_query_mode', self.rate_query_mode)
+                self.batch_queries = bool(config.get('batch_queries', self.batch_queries))
+                self.mvtx_incremental = bool(config.get('mvtx_incremental', self.mvtx_incremental))
+                self.mvtx_resync_period = float(config.get('mvtx_resync_period', self.mvtx_resync_period))
+                self.archive_dir = config.get('archive_dir', self.archive_dir)
+                self.archive_load_hours = float(config.get('archive_load_hours', self.archive_load_hours))
+                self.archive_days = get_optional(config, 'archive_days', self.archive_days, int)
+                self.backfill_hours = float(config.get('backfill_hours', self.backfill_hours))
+                self.backfill_step = float(config.get('backfill_step', self.backfill_step))
+                self.metrics_port = get_optional(config, 'metrics_port', self.metrics_port, int)
+                self.publish_address = config.get('publish_address', self.publish_address)
+                self.subscribe_address = config.get('subscribe_address', self.subscribe_address)
+                self.cache_ttls = get_optional(config, 'cache_ttls', self.cache_ttls, dict)
+                self.adaptive_polling = bool(config.get('adaptive_polling', self.adaptive_polling))
+                self.min_check_time = float(config.get('min_check_time', self.min_check_time))
+                self.idle_check_time = float(config.get('idle_check_time', self.idle_check_time))
+                self.stable_check_time = get_optional(config, 'stable_check_time', self.stable_check_time, float)
+                self.run_poll_time = get_optional(config, 'run_poll_time', self.run_poll_time, float)
+                self.run_start_lookback = int(config.get('run_start_lookback', self.run_start_lookback))
             self.status_label.config(text="Configuration loaded", foreground='black')
         except FileNotFoundError:
             # print("No configuration file found.")
             self.status_label.config(text="No configuration file found.", foreground='black')
 
+    def get_archive_path(self):
+        if self.archive_dir is None:
+            return None
+        return os.path.join(self.repo_dir, self.archive_dir)  # Absolute archive_dir is kept as is by join
+
+    def load_archive_history(self):
+        """
+        Fill the rate plot history from the on-disk snapshot archive, so a restarted GUI shows recent rates.
+        :return:
+        """
+        if self.get_archive_path() is None or self.archive_load_hours <= 0:
+            return
+        try:
+            times, rates = read_archive_rates(self.get_archive_path(), since=time() - self.archive_load_hours * 3600)
+            self.rate_history.extend(times, rates / 1000)
+        except Exception as e:
+            print(f'Error loading snapshot archive: {e}')
+
+    def get_backfill_gaps(self, start, end):
+        """
+        Find the spans between start and end with no archived rate points, so a GUI restarted after a break backfills
+        the break as well as the time before the archive.
+        :param start: seconds since epoch
+        :param end: seconds since epoch
+        :return: List of (start, end) gaps longer than backfill_min_gap, most recent first.
+        """
+        times = self.rate_history.get_window()[0]
+        edges = [start] + [float(t) for t in times if start < t < end] + [end]
+        gaps = [(gap_start, gap_end) for gap_start, gap_end in zip(edges[:-1], edges[1:])
+                if gap_end - gap_start > self.backfill_min_gap]
+        return gaps[::-1]
+
+    def backfill_rate_history(self, gaps):
+        """
+        Runs on its own thread. Fetch rates in each gap from Prometheus and queue chunks to be merged into the plot
+        history on the Tk loop as they arrive.
+        :param gaps: List of (start, end) in seconds since epoch.
+        :return:
+        """
+        for start, end in gaps:
+            if end - start >= self.backfill_step:
+                self.watcher.backfill_rate(start, end, self.backfill_step, self.backfill_queue.put)
+
     def update_param_display(self):
         self.rate_value.config(text=self.watcher.rate_threshold)
         self.intgration_time_value.config(text=self.watcher.integration_time)
@@ -331,26 +516,69 @@ class DAQWatchGUI:
         self.mvtx_alarm_var.set(self.mvtx_alerts)
 
     def update_time_since(self):
+        time_since = datetime.now() - self.last_check
+
+        # Update time_since label in number of seconds since last check
+        num_seconds = time_since.total_seconds()
+        if num_seconds < 60:
+            time_since_str = f"{num_seconds:.0f} sec ago"
+        elif num_seconds < 3600:
+            time_since_str = f"{num_seconds / 60:.0f} min ago"
+        elif num_seconds < 86400:
+            time_since_str = f"{num_seconds / 3600:.0f} hr ago"
+        else:
+            time_since_str = f"{num_seconds / 86400:.0f} days ago"
+        self.time_since.config(text=time_since_str)
+        self.root.after(self.time_since_period, self.update_time_since)
+
+    def publish_snapshot(self, snapshot):
+        """
+        Queue a snapshot from the watcher thread for the GUI. If the GUI has fallen behind and the queue is full, the
+        oldest snapshot is dropped.
+        :param snapshot: WatchSnapshot
+        :return:
+        """
         while True:
-            # Get last check from self.date_time and convert to datetime object
-            last_check_str = self.date_time.cget('text')
-            last_check = datetime.strptime(last_check_str, "%m-%d %H:%M:%S")
-            # Set last_check to current year
-            last_check = last_check.replace(year=datetime.now().year)
-            time_since = datetime.now() - last_check
-
-            # Update time_since label in number of seconds since last check
-            num_seconds = time_since.total_seconds()
-            if num_seconds < 60:
-                time_since_str = f"{num_seconds:.0f} sec ago"
-            elif num_seconds < 3600:
-                time_since_str = f"{num_seconds / 60:.0f} min ago"
-            elif num_seconds < 86400:
-                time_since_str = f"{num_seconds / 3600:.0f} hr ago"
-            else:
-                time_since_str = f"{num_seconds / 86400:.0f} days ago"
-            self.time_since.config(text=time_since_str)
-            sleep(10)
+            try:
+                self.snapshot_queue.put_nowait(snapshot)
+                return
+            except Full:
+                try:
+                    self.snapshot_queue.get_nowait()
+                except Empty:
+                    pass
+
+    def drain_snapshots(self):
+        """
+        Runs on the Tk main loop. Take all queued snapshots and backfilled rate chunks, add every rate point to the
+        plot, and update the displays once from the latest snapshot.
+        :return:
+        """
+        snapshots = []
+        while True:
+            try:
+                snapshots.append(self.snapshot_queue.get_nowait())
+            except Empty:
+                break
+        backfilled = False
+        while True:
+            try:
+                points = self.backfill_queue.get_nowait()
+            except Empty:
+                break
+            times, rates = zip(*points)
+            self.rate_history.merge(times, [rate / 1000 for rate in rates])
+            backfilled = True
+        if len(snapshots) > 0:
+            rate_points = [(snap.time, snap.rate / 1000) for snap in snapshots if snap.rate is not None]
+            first_poll = self.last_snapshot is None
+            self.last_snapshot = snapshots[-1]
+            self.update_gui(coalesce_snapshots(snapshots), rate_points)
+            if first_poll:
+                self.startup_mark('first poll displayed')
+        elif backfilled:  # Redraw plot with the backfilled points
+            self.draw_rate_history()
+        self.root.after(self.drain_period, self.drain_snapshots)
 
     def set_parameters(self):
         set_rate_threshold = self.rate_entry.get()
@@ -424,10 +652,20 @@ class DAQWatchGUI:
         self.watcher.silence = self.silence
         self.status_label.config(text="Alarm silenced" if self.silence else "Alarm Unsilenced")
 
-    def update_gui(self, run_num, rate, run_time, mvtx_mixed_staves, mvtx_new_mixed_staves,
-                   rate_alert, run_time_alert, mvtx_alert, junk, new_run=False):
-        refresh_time = datetime.now()
-        refresh_time_str = refresh_time.strftime("%m-%d %H:%M:%S")
+    def update_gui(self, snapshot, rate_points):
+        """
+        Update the displays and plot. Only call from the Tk main loop.
+        :param snapshot: Latest WatchSnapshot
+        :param rate_points: List of (epoch seconds, rate in kHz) points to add to the rate plot.
+        :return:
+        """
+        run_num, rate, run_time = snapshot.run_num, snapshot.rate, snapshot.run_time
+        mvtx_mixed_staves, mvtx_new_mixed_staves = snapshot.mvtx_mixed_staves, snapshot.mvtx_new_mixed_staves
+        rate_alert, run_time_alert, mvtx_alert = snapshot.rate_alert, snapshot.run_time_alert, snapshot.mvtx_alert
+        junk, new_run = snapshot.junk, snapshot.new_run
+
+        self.last_check = datetime.fromtimestamp(snapshot.time)
+        refresh_time_str = self.last_check.strftime("%m-%d %H:%M:%S")
         self.date_time.config(text=refresh_time_str)
 
         if run_time is None:
@@ -460,24 +698,13 @@ class DAQWatchGUI:
 
         if rate is None:
             self.rate_display.config(text="Not Running")
-            y_top = None
         else:
             self.rate_display.config(text=f"{rate / 1000:.2f} kHz")
-            self.time_data.append(refresh_time)
-            self.rate_data.append(rate / 1000)
-            y_top = max(max(self.rate_data), self.rate_threshold / 1000) * 1.1
 
-        # Update graph data
-        self.time_data = self.time_data[-self.max_graph_points:]  # Keep only the last n data points
-        self.rate_data = self.rate_data[-self.max_graph_points:]
-
-        self.line.set_data(self.time_data[-self.graph_points:], self.rate_data[-self.graph_points:])
-        self.thresh_line.set_ydata([self.rate_threshold / 1000, self.rate_threshold / 1000])
-        if y_top is not None and y_top > 0:
-            self.ax.set_ylim(0, y_top)
-        self.ax.relim()
-        self.ax.autoscale_view()
-        self.canvas.draw()
+        # Update graph data. History keeps only the last max_graph_points.
+        for point_time, point_rate in rate_points:
+            self.rate_history.append(point_time, point_rate)
+        self.draw_rate_history(rate is not None)
 
         if self.status_label.cget('text') != self.previous_status:
             self.previous_status = self.status_label.cget('text')
@@ -508,6 +735,74 @@ class DAQWatchGUI:
                 else:
                     self.status_label.config(text="Not Running", foreground='black', font=('Helvetica', 12, 'italic'))
 
+    def draw_rate_history(self, rescale_y=True):
+        """
+        Plot the latest graph_points of the rate history, if the plot has been created.
+        :param rescale_y: Fit the y-axis to the history max, else leave it unchanged.
+        :return:
+        """
+        if self.canvas is None:
+            return
+        y_top = None
+        if rescale_y and len(self.rate_history) > 0:
+            y_top = max(self.rate_history.max(), self.rate_threshold / 1000) * 1.1
+        plot_width = max(self.canvas.get_tk_widget().winfo_width(), 100)  # pixels
+        times, rates = self.plot_decimator.decimate(self.rate_history, self.graph_points, plot_width // 2)
+        self.update_plot(times / 86400, rates, y_top)
+
+    def update_plot(self, x, y, y_top):
+        """
+        Update the rate plot. If the data still fits in the current axes only the line and threshold are redrawn over
+        the cached background, otherwise the axes are rescaled and the whole canvas redrawn.
+        :param x: Times of points to plot, matplotlib date numbers.
+        :param y: Rates of points to plot in kHz.
+        :param y_top: Top of the y-axis or None to leave unchanged.
+        :return:
+        """
+        start = perf_counter()
+        self.line.set_data(x, y)
+        self.thresh_line.set_ydata([self.rate_threshold / 1000, self.rate_threshold / 1000])
+
+        x_min, x_max = self.ax.get_xlim()
+        new_y_top = y_top is not None and y_top > 0 and y_top != self.ax.get_ylim()[1]
+        x_out = len(x) > 0 and (x[-1] > x_max or x[0] < x_min)
+        if self.plot_background is None or new_y_top or x_out:
+            if new_y_top:
+                self.ax.set_ylim(0, y_top)
+            if len(x) > 0:
+                x_start, x_end = x[0], x[-1]
+                x_span = max(x_end - x_start, 1 / 86400)  # At least a second
+                self.ax.set_xlim(x_start, x_end + x_span * self.plot_x_headroom)
+            self.canvas.draw()  # Recaches background in on_plot_draw
+            self.full_draw_times.append(perf_counter() - start)
+        else:
+            self.canvas.restore_region(self.plot_background)
+            self.ax.draw_artist(self.line)
+            self.ax.draw_artist(self.thresh_line)
+            self.canvas.blit(self.fig.bbox)
+            self.blit_update_times.append(perf_counter() - start)
+
+    def on_plot_draw(self, event):
+        """
+        Full canvas draw, on rescale or window resize. Cache the static background and draw the animated artists.
+        """
+        self.plot_background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.thresh_line)
+
+    def get_plot_update_stats(self):
+        """
+        Measured cost of plot updates.
+        :return: Dictionary of mean ms per blitted update, mean ms per full redraw and updates per second these
+                 allow, None where there are no measurements yet.
+        """
+        stats = {}
+        for name, times in [('blit', self.blit_update_times), ('full_draw', self.full_draw_times)]:
+            ms = sum(times) / len(times) * 1000 if len(times) > 0 else None
+            stats[f'{name}_ms'] = ms
+            stats[f'{name}_fps'] = 1000 / ms if ms else None
+        return stats
+
     def show_sound_control(self):
         """
         Create pop up window with sound control options. A label for each of the two sound file paths
@@ -545,8 +840,9 @@ class DAQWatchGUI:
         alarm_sound_button = ttk.Button(sound_control_window, text="Select Alarm Sound",
                                         command=self.select_alarm_sound)
         alarm_sound_button.grid(row=3, column=0, pady=10, padx=10)
-        alarm_sound_play_button = ttk.Button(sound_control_window, text="Play Alarm Sound", command=lambda: os.system(
-            f'aplay {self.watcher.alert_sound_file} > /dev/null 2>&1'))
+        alarm_sound_play_button = ttk.Button(sound_control_window, text="Play Alarm Sound",
+                                             command=lambda: self.watcher.sound_player.play(
+                                                 self.watcher.alert_sound_file))
         alarm_sound_play_button.grid(row=3, column=1, pady=10, padx=10)
 
         # Add extra space after 2nd row
@@ -563,8 +859,8 @@ class DAQWatchGUI:
                                           command=self.select_run_end_sound)
         run_end_sound_button.grid(row=6, column=0, pady=10, padx=10)
         run_end_sound_play_button = ttk.Button(sound_control_window, text="Play Run End Sound",
-                                               command=lambda: os.system(
-                                                   f'aplay {self.watcher.run_end_sound_file} > /dev/null 2>&1'))
+                                               command=lambda: self.watcher.sound_player.play(
+                                                   self.watcher.run_end_sound_file))
         run_end_sound_play_button.grid(row=6, column=1, pady=10, padx=10)
 
         # Add extra space after 5th row
@@ -580,8 +876,8 @@ class DAQWatchGUI:
                                             command=self.select_run_start_sound)
         run_start_sound_button.grid(row=9, column=0, pady=10, padx=10)
         run_start_sound_play_button = ttk.Button(sound_control_window, text="Play Run Start Sound",
-                                                command=lambda: os.system(
-                                                    f'aplay {self.watcher.run_start_sound_file} > /dev/null 2>&1'))
+                                                command=lambda: self.watcher.sound_player.play(
+                                                    self.watcher.run_start_sound_file))
         run_start_sound_play_button.grid(row=9, column=1, pady=10, padx=10)
 
         # Add extra space after 7th row
@@ -597,8 +893,8 @@ class DAQWatchGUI:
                                                     command=self.select_mvtx_staves_alarm_sound)
         mvtx_staves_alarm_sound_button.grid(row=12, column=0, pady=10, padx=10)
         mvtx_staves_alarm_sound_play_button = ttk.Button(sound_control_window, text="Play MVTX Staves Alarm Sound",
-                                                        command=lambda: os.system(
-                                                            f'aplay {self.watcher.mvtx_alert_sound_file} > /dev/null 2>&1'))
+                                                        command=lambda: self.watcher.sound_player.play(
+                                                            self.watcher.mvtx_alert_sound_file))
         mvtx_staves_alarm_sound_play_button.grid(row=12, column=1, pady=10, padx=10)
 
         # Add extra space after 12th row
@@ -667,6 +963,81 @@ class DAQWatchGUI:
             self.mvtx_staves_alarm_path_label.config(text=mvtx_staves_alarm_sound_file)
             self.status_label.config(text=f"MVTX staves alarm sound file set", foreground='black')
 
+    def show_diagnostics(self):
+        """
+        Create pop up window showing the health of each query: latency, errors, cycles without a value and time since
+        the last success, along with the achieved poll period and plot update cost. Refreshes every diagnostics_period
+        ms.
+        :return:
+        """
+        diagnostics_window = Toplevel(self.root)
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("900x420")
+
+        diagnostics_text_widget = Text(diagnostics_window, wrap='none', font=('Courier', 11), padx=10, pady=10)
+        diagnostics_text_widget.pack(expand=True, fill=tk.BOTH)
+
+        close_button = Button(diagnostics_window, text="Close", command=diagnostics_window.destroy)
+        close_button.pack(pady=10)
+
+        def refresh():
+            if not diagnostics_window.winfo_exists():
+                return
+            diagnostics_text_widget.config(state=tk.NORMAL)
+            diagnostics_text_widget.delete('1.0', tk.END)
+            diagnostics_text_widget.insert(tk.END, self.get_diagnostics_text())
+            diagnostics_text_widget.config(state=tk.DISABLED)
+            diagnostics_window.after(self.diagnostics_period, refresh)
+
+        refresh()
+
+    def get_diagnostics_text(self):
+        diagnostics = self.watcher.get_diagnostics()
+        now = time()
+
+        def fmt(value):
+            return f'{value:.1f}' if value is not None else '-'
+
+        def ms(seconds):
+            return fmt(seconds * 1000 if seconds is not None else None)
+
+        def ago(timestamp):
+            return f'{now - timestamp:.0f}s ago' if timestamp is not None else 'never'
+
+        lines = [f'{"Query":<22} {"Count":>6} {"Errors":>6} {"No val":>6} {"p50 ms":>8} {"p95 ms":>8} {"Max ms":>8}  '
+                 f'{"Last success":<14} Last error']
+        for name, stats in diagnostics['queries'].items():
+            last_error = ''
+            if stats['last_error'] is not None:
+                errors = ', '.join(f'{kind} {count}' for kind, count in stats['errors'].items())
+                last_error = f'{ago(stats["last_error"])} ({errors}): {stats["last_error_message"][:60]}'
+            lines.append(f'{name:<22} {stats["count"]:>6} {stats["error_count"]:>6} {stats["no_value"]:>6} '
+                         f'{ms(stats["p50"]):>8} {ms(stats["p95"]):>8} {ms(stats["max"]):>8}  '
+                         f'{ago(stats["last_success"]):<14} {last_error}')
+
+        lines.append('')
+        lines.append('Latency histogram (requests per bucket, upper bound in ms):')
+        for name, stats in diagnostics['queries'].items():
+            previous, counts = 0, []
+            for bound, cumulative in stats['buckets'].items():
+                if cumulative > previous:
+                    counts.append(f'<={bound * 1000:g}: {cumulative - previous}')
+                previous = cumulative
+            lines.append(f'  {name:<22} {"  ".join(counts)}')
+
+        lines.append('')
+        lines.append(f'Poll period: {ms(diagnostics["period"])} ms, jitter {ms(diagnostics["jitter"])} ms, '
+                     f'skipped ticks {diagnostics["skipped_ticks"]}, last fan-out '
+                     f'{ms(diagnostics["cycle_query_time"])} ms')
+        lines.append(f'Next poll in: {diagnostics["check_period"]:g} s ({diagnostics["check_period_reason"]})')
+        cache = diagnostics['cache']
+        lines.append(f'Response cache: {cache["hits"]} hits, {cache["coalesced"]} coalesced, {cache["misses"]} requests, '
+                     f'{cache["entries"]} entries')
+        plot_stats = self.get_plot_update_stats()
+        lines.append(f'Plot update: blit {fmt(plot_stats["blit_ms"])} ms, full draw {fmt(plot_stats["full_draw_ms"])} ms, '
+                     f'snapshot queue {self.snapshot_queue.qsize()}')
+        return '\n'.join(lines)
+
     def show_readme(self):
         # Create the pop-up window
         readme_window = Toplevel(self.root)
@@ -701,7 +1072,7 @@ This application monitors the DAQ rate from the Prometheus database via a Grafan
             "Check Time (s): The interval between each database poll. Database updated every 2 seconds, so no need to poll more frequently than every 1 or 2 seconds. Times much longer than this will delay alarm in case of true DAQ stall.",
             "Target Run Time (min): The targeted max time for each run. Only used if 'Run Time Reminder' is enabled.",
             "Alarm Points Cushion: The number of consecutive low rate reads required before sounding the alarm. 1 will sound the alarm on the first low rate read. Probably keep at 1 if false positive rate low, else 2 should be ok. The larger this is the further delayed a true alarm will be.",
-            "New Run Cushion (s): The time to wait after a new run starts before alerting on low rate. ~10-30 seconds should be fine.",
+            "New Run Cushion (s): The time to wait after a new run starts before alerting on low rate. Run time is taken from when Prometheus first saw the run, so this only needs to cover the rate ramping up. ~10-30 seconds should be fine.",
             "Graph Points: The number of points to display on the rate plot.",
         ]
 
@@ -717,7 +1088,8 @@ This application monitors the DAQ rate from the Prometheus database via a Grafan
             "Run Time Reminder: Option to alert when the target run time is reached to remind the user to start a new run.",
             "MVTX Staves Alarm: Option to alert when there are MVTX staves in a mixed state. If only one, alarms after run. If more than one, alarms immediately.",
             "Readme: Display this readme.",
-            "Sound Control: Open a window to select sound files for the alarm and run end alerts. Not really tested..."
+            "Sound Control: Open a window to select sound files for the alarm and run end alerts. Not really tested...",
+            "Diagnostics: Open a window showing the latency, errors and last success of each database query. Use to tell a slow or failing query from a stopped run."
         ]
         for item in buttons:
             readme_text_widget.insert(tk.END, f"  • {item}\n", 'bullet')
@@ -727,7 +1099,7 @@ This application monitors the DAQ rate from the Prometheus database via a Grafan
             "Last Check: Displays the timestamp of the last time the database was polled. Should be current time.",
             "Last Checked: Shows the time since the last check. Updates every 10 seconds.",
             "Run Number: Shows the current run number.",
-            "Run Time: Indicates the elapsed time for the current run. Only starts counting once the GUI has been opened.",
+            "Run Time: Indicates the elapsed time for the current run, from the first Prometheus sample of the run number. If the run started more than 'run_start_lookback' (10 min by default) before the GUI was opened, only starts counting once the GUI has been opened.",
             "Mixed Staves: Displays the number of MVTX staves currently in a mixed state.",
             "Current Rate: Displays the current DAQ rate.",
             "Rate Plot: A graph showing the DAQ rate over time, updated with each check."
@@ -747,3 +1119,28 @@ This application monitors the DAQ rate from the Prometheus database via a Grafan
         close_button = Button(readme_window, text="Close", command=readme_window.destroy)
         close_button.pack(pady=10)
 
+
+
+def get_optional(config, key, default, convert):
+    """
+    Config value which may be null, converted as headless.get_watcher_kwargs does so hand edited strings work.
+    :return: default if missing or empty, None if null, else the converted value.
+    """
+    value = config.get(key, '')
+    if value == '':
+        return default
+    return convert(value) if value is not None else None
+
+
+def coalesce_snapshots(snapshots):
+    """
+    Combine snapshots queued since the last GUI update into one. Displays take the latest state, but one-off events
+    (new run, new mixed staves) from earlier snapshots are kept so they aren't missed.
+    :param snapshots: List of WatchSnapshot, oldest first.
+    :return: WatchSnapshot
+    """
+    latest = snapshots[-1]
+    if len(snapshots) == 1:
+        return latest
+    return latest._replace(new_run=any(snap.new_run for snap in snapshots),
+                           mvtx_new_mixed_staves=sum(snap.mvtx_new_mixed_staves for snap in snapshots))
@@ -9,14 +9,47 @@ Created as sPHENIX_DAQ_Watch/DAQWatcher
 """
 
 import os
+import re
+import logging
 import requests
-from time import sleep, time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from time import time, perf_counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple
+from threading import Event
+
+from CycleScheduler import CycleScheduler, AdaptivePeriod
+from SoundPlayer import SoundPlayer
+from RateEstimator import RateEstimator
+from QueryStats import QueryStats
+from ResponseCache import ResponseCache, get_request_key
+from PrometheusExtract import extract_first_last_samples, extract_single_value, extract_first_filename
+from SnapshotArchive import SnapshotArchiveWriter
+from MetricsExporter import MetricsExporter
+from ReadingShare import ReadingPublisher, ReadingSubscriber
+from RunTracker import RunTracker
+
+
+# Errors go through logging rather than print, so records from the concurrent query threads never interleave
+log = logging.getLogger(__name__)
+
+
+# Immutable result of one watch cycle, handed to the update callback
+WatchSnapshot = namedtuple('WatchSnapshot', ['time', 'run_num', 'rate', 'run_time', 'mvtx_mixed_staves',
+                                             'mvtx_new_mixed_staves', 'rate_alert', 'run_time_alert', 'mvtx_alert',
+                                             'junk', 'new_run', 'daq_file_name', 'silence'])
 
 
 class DAQWatcher:
     def __init__(self, update_callback=None, rate_threshold=100, new_run_cushion=30, integration_time=10, check_time=1,
                  target_run_time=60, rate_alarm_cushion=2, alert_sound_file='prompt.wav', run_end_sound_file='xylofon.wav',
-                 grafana_url='http://localhost:7815', database_uid='EflW1u9nz'):
+                 grafana_url='http://localhost:7815', database_uid='EflW1u9nz', connect_timeout=3, read_timeout=5,
+                 request_retries=2, retry_backoff=0.3, sound_backend=None, rate_query_mode='range',
+                 rate_windows=(10, 60, 300), batch_queries=False, mvtx_incremental=False, mvtx_resync_period=300,
+                 archive_dir=None, metrics_port=None, publish_address=None, subscribe_address=None, cache_ttls=None,
+                 cache_size=64, adaptive_polling=False, min_check_time=1, idle_check_time=10, stable_check_time=None,
+                 run_poll_time=None, run_start_lookback=600, archive_days=30):
         self.update_callback = update_callback
         self.rate_threshold = rate_threshold
         self.new_run_cushion = new_run_cushion
@@ -29,17 +62,36 @@ class DAQWatcher:
         self.daq_file_params = {
             'query': 'max by(run, filename, hostname) (sphenix_rcdaq_file_size_Byte{hostname=\"gl1daq\"})',
             'instant': 'false'}
+        # 'range' to pull raw l1count samples, 'rate' for server-side rate(), 'incremental' for local rolling buffer
+        self.rate_query_mode = rate_query_mode
+        self.rate_windows = tuple(rate_windows)  # seconds Extra windows to compute rates over in 'incremental' mode
+        self.rate_estimator = RateEstimator(max(self.rate_windows + (integration_time,)))
+        self.rates = {}  # seconds window -> Hz rate, filled in 'incremental' mode
         self.rate_params = self.get_rate_params()
+        self.server_rate_params = self.get_server_rate_params()
         self.mvtx_om_memory_params = {
             'query': 'sphenix_rcdaq_root_exe_memory_rss_B{hostname=~"mvtx0|mvtx1|mvtx2|mvtx3|mvtx4|mvtx5"}',
             'instant': 'true'}
         self.endpoint_url = f'{self.grafana_url}/api/datasources/proxy/uid/{self.database_uid}/api/v1/query'
+        self.range_endpoint_url = f'{self.endpoint_url}_range'
 
         self.query_url = f'{self.grafana_url}/api/ds/query'
         self.mvtx_mixed_staves_json = get_mvtx_mixed_staves_json()
 
+        # Incremental MVTX stave query, only fetch rows newer than the last Zeit seen and keep latest per DPE locally
+        self.mvtx_incremental = mvtx_incremental
+        self.mvtx_resync_period = mvtx_resync_period  # seconds Time between full resyncs of the per-DPE values
+        self.mvtx_stave_values = {}  # DPE -> (Zeit, Wert) latest value for each stave
+        self.mvtx_watermark = None  # Latest Zeit seen, as the database's own DATETIME text so no time zone is applied
+        self.mvtx_last_resync = None
+        self.mvtx_resyncing = False
+
         self.mvtx_stave_threshold = 1
         self.start_time_offset = 3  # seconds We get info about start time late, so try to adjust
+        # Take run start times from the Prometheus samples of the run number instead, falling back on the offset
+        self.run_start_lookback = run_start_lookback  # seconds Run number history searched for the run start
+        self.run_sample_gap = 10  # seconds Longer than this between run number samples means the run had stopped
+        self.run_start_lookup = (None, None)  # (run number, start time) of the last run start looked up
 
         # self.frac_max_points = 0.8  # Demand at least this fraction of expected points be present for average
         # self.database_refresh_period = 2  # seconds Time between database refreshes
@@ -58,6 +110,14 @@ class DAQWatcher:
         self.run_start_sound_file = os.path.join(self.repo_dir, run_end_sound_file)
         self.mvtx_alert_sound_file = os.path.join(self.repo_dir, alert_sound_file)
 
+        # Sounds play from their own worker so the watch loop never blocks on playback. Lower plays first.
+        self.sound_player = SoundPlayer(sound_backend)
+        self.sound_player.preload({self.alert_sound_file, self.run_end_sound_file})
+        self.alert_sound_priority = 0
+        self.mvtx_alert_sound_priority = 1
+        self.run_start_sound_priority = 2
+        self.run_end_sound_priority = 3
+
         self.silence = False
         self.target_run_time = target_run_time  # minutes Targeted run time, alert when reached
         self.run_time_reminder = False
@@ -67,28 +127,228 @@ class DAQWatcher:
         self.rate = None
         self.latest_daq_file_name = None
 
+        self.run_time_alert_counter, self.low_rate_counter, self.no_run_num_count = 0, 0, 0
+        self.last_low_rate_count_time = None  # Time of the last low rate read counted towards rate_alarm_cushion
+
+        # Append every snapshot to an on-disk archive if a directory is given. Subscribers don't, the publisher
+        # already archives the same readings.
+        self.archive = SnapshotArchiveWriter(archive_dir, max_days=archive_days) \
+            if archive_dir is not None and subscribe_address is None else None
+        self.scheduler = CycleScheduler()
+        # Vary the time between cycles with the run state instead of always waiting check_time
+        self.adaptive_period = AdaptivePeriod(min_check_time, idle_check_time, stable_check_time) \
+            if adaptive_polling else None
+        self.stop_event = Event()
+        self.wake_event = Event()  # Set to run the next cycle straight away, on a run transition
+
+        # Per-cycle queries are independent, so issue them concurrently and join into one snapshot
+        self.cycle_queries = {
+            'run_num': self.get_run_number,
+            'rate': self.get_rate,
+            'latest_daq_file_name': self.get_latest_daq_file_name,
+            'mvtx_mixed_staves': self.get_mvtx_mixed_staves,
+        }
+        self.batch_queries = batch_queries  # Send all per-cycle queries in one /api/ds/query request
+        self.query_pool = ThreadPoolExecutor(max_workers=len(self.cycle_queries), thread_name_prefix='DAQ Query')
+
+        # Optionally poll the run number every run_poll_time on its own thread and run a cycle as soon as it changes
+        self.run_tracker = None
+        if run_poll_time is not None:
+            self.run_tracker = RunTracker(self.get_run_number, run_poll_time, self.on_run_change)
+            self.cycle_queries['run_num'] = self.run_tracker.get_run_number
+
+        # Pooled keep-alive transport. Timeouts so a hung Grafana proxy can't stall the watcher thread forever.
+        self.timeout = (float(connect_timeout), float(read_timeout))  # seconds (connect, read)
+        self.request_retries = int(request_retries)
+        self.retry_backoff = float(retry_backoff)
+        self.backfill_workers = 4  # Rate history chunks fetched at once
+        self.session = self.create_session()
+        self.query_times = {}  # seconds Latency of each query in the last cycle
+        self.cycle_query_time = None  # seconds Wall time of the last concurrent fan-out
+        self.query_stats = QueryStats()  # Latency histograms, errors and last success time of each query
+        # Identical requests share one response, in flight or for a short time per query after
+        self.response_cache = ResponseCache(cache_ttls, cache_size)
+
+        # Latest snapshot, and optionally serve it with the query stats as Prometheus metrics on metrics_port
+        self.snapshot = None
+        self.metrics_exporter = self.create_metrics_exporter(metrics_port) if metrics_port is not None else None
+
+        # One watcher polls Grafana and publishes its readings, others subscribe and only run the alarms locally
+        self.publisher = self.create_publisher(publish_address) if publish_address is not None else None
+        # Publisher's cycles are at most the longest period this config polls at, reconnect after missing a few
+        subscribe_timeout = 3 * max(check_time, idle_check_time, stable_check_time or 0)
+        self.subscriber = ReadingSubscriber(subscribe_address, read_timeout=subscribe_timeout) \
+            if subscribe_address is not None else None
+
+    def create_metrics_exporter(self, port):
+        """
+        Serve /metrics on port. If it can't be bound, for example another watcher from the same config already serves
+        there, keep watching without the exporter rather than failing to start.
+        :return: Started MetricsExporter, None on failure.
+        """
+        try:
+            return MetricsExporter(self, port).start()
+        except OSError as e:
+            log.error(f'Could not serve metrics on port {port}, continuing without them: {e}')
+            return None
+
+    def create_publisher(self, address):
+        """
+        Start publishing readings on address. If it can't be bound, for example another watcher from the same config
+        already publishes there, keep polling without publishing rather than failing to start.
+        :return: ReadingPublisher, None on failure.
+        """
+        try:
+            return ReadingPublisher(address)
+        except (OSError, ValueError) as e:
+            log.error(f'Could not publish readings on {address}, polling without publishing: {e}')
+            return None
+
     def get_rate_params(self):
         query = f'sphenix_gtm_gl1_json_dump_l1count{{}}[{self.integration_time}s]'
         return {'query': query, 'instant': 'true'}
 
-    def fetch_data(self, params):
+    def get_server_rate_params(self):
+        query = f'rate(sphenix_gtm_gl1_json_dump_l1count{{}}[{self.integration_time}s])'
+        return {'query': query, 'instant': 'true'}
+
+    def create_session(self):
+        """
+        Create a requests session with one connection pool sized for everything which can use it at once: the per-cycle
+        queries, the backfill workers and the run tracker. Connection errors and gateway errors are retried with exponential backoff.
+        :return: Configured requests.Session
+        """
+        retry = Retry(total=self.request_retries, connect=self.request_retries, read=self.request_retries,
+                      status=self.request_retries, backoff_factor=self.retry_backoff,
+                      status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(['GET', 'POST']),
+                      raise_on_status=False)
+        pool_size = len(self.cycle_queries) + self.backfill_workers + 1
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=2, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def fetch_data(self, params, name='other', url=None, extract=None):
+        """
+        GET a Prometheus API query through the Grafana proxy, or from the response cache.
+        :param params: Query parameters.
+        :param name: Query name for the diagnostics and cache TTL.
+        :param url: Endpoint url, the instant query endpoint if None.
+        :param extract: Function from PrometheusExtract pulling only the needed fields out of the response bytes,
+                        None to decode the whole response.
+        :return: Decoded response, None on failure.
+        """
+        url = url or self.endpoint_url
+        key = get_request_key(url, params=params) + (extract.__name__ if extract is not None else None,)
+        return self.response_cache.get(key, name, lambda: self.request_data(params, name, url, extract))
+
+    def post_query(self, payload, name='other'):
+        """
+        POST an /api/ds/query payload, or get its response from the response cache.
+        :param payload: Query payload.
+        :param name: Query name for the diagnostics and cache TTL.
+        :return: Decoded response, None on failure.
+        """
+        return self.response_cache.get(get_request_key(self.query_url, payload=payload), name,
+                                       lambda: self.request_query(payload, name))
+
+    def request_data(self, params, name, url, extract=None):
+        """
+        GET a Prometheus API query through the Grafana proxy and record its latency and outcome under name. The
+        whole response is decoded if there is no extract function or it can't handle the response.
+        """
+        start = perf_counter()
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            data = extract(response.content) if extract is not None else None
+            if data is None:
+                data = response.json()
+        except Exception as e:
+            self.query_stats.record(name, perf_counter() - start, e)
+            log.error(f'Error fetching {name} data: {e}', extra={'fields': {'query': name}})
+            return None
+        self.query_stats.record(name, perf_counter() - start, get_response_error(response))
+        return data
+
+    def request_query(self, payload, name):
+        start = perf_counter()
         try:
-            response = requests.get(self.endpoint_url, params=params)
-            return response.json()
+            response = self.session.post(self.query_url, json=payload, timeout=self.timeout)
+            data = response.json()
         except Exception as e:
-            print(f'Error fetching data: {e}')
+            self.query_stats.record(name, perf_counter() - start, e)
+            log.error(f'Error posting {name} query: {e}', extra={'fields': {'query': name}})
             return None
+        self.query_stats.record(name, perf_counter() - start, get_response_error(response))
+        return data
 
     def get_run_number(self):
-        data = self.fetch_data(self.run_params)
+        return self.parse_run_number(self.fetch_data(self.run_params, 'run_num', extract=extract_single_value))
+
+    def parse_run_number(self, data):
         if data and 'data' in data and 'result' in data['data']:
             result = data['data']['result']
             if len(result) == 1:
                 return int(result[0]['value'][-1])
         return None
 
+    def get_run_start(self, run_num):
+        """
+        Get the start time of a run from the first Prometheus sample of the run number, looked up once per run.
+        :param run_num: Run number, current or just started.
+        :return: seconds since epoch, accurate to the scrape interval. None if not running, on failure, or if the run
+                 started before the lookback.
+        """
+        if run_num is None:
+            return None
+        if self.run_start_lookup[0] != run_num:
+            params = {'query': f'{self.run_params["query"]}[{int(self.run_start_lookback)}s]', 'instant': 'true'}
+            window_start = time() - self.run_start_lookback
+            self.run_start_lookup = (run_num, self.parse_run_start(self.fetch_data(params, 'run_start'), run_num,
+                                                                   window_start))
+        return self.run_start_lookup[1]
+
+    def parse_run_start(self, data, run_num, window_start):
+        """
+        Find the first sample of the latest unbroken stretch of run_num samples, counting back from the latest.
+        :param data: Range vector response of the run number.
+        :param run_num: Run number to find the start of.
+        :param window_start: seconds since epoch Start of the range vector window.
+        :return: seconds since epoch Time of the first sample of the run, None if not found within the window.
+        """
+        if not (data and 'data' in data and 'result' in data['data']):
+            log.error(f'Error fetching run start, no data or result: {data}')
+            return None
+        for series in data['data']['result']:
+            values = series.get('values') if isinstance(series, dict) else None
+            try:
+                if not values or int(values[-1][1]) != run_num:
+                    continue
+                start = None
+                for t, run in reversed(values):
+                    if int(run) != run_num or (start is not None and start - float(t) > self.run_sample_gap):
+                        return start  # Previous run, or the run number was missing, before start
+                    start = float(t)
+            except (TypeError, ValueError, IndexError) as e:
+                log.error(f'Error fetching run start, malformed run number series: {e}')
+                return None
+            # Run samples all the way back, only know the start if there is a gap before the first one
+            return start if start - window_start > self.run_sample_gap else None
+        return None
+
+    def on_run_change(self, run_num):
+        """
+        Called from the run tracker on a run transition. Look up the new run's start and run a cycle now.
+        """
+        self.get_run_start(run_num)
+        self.wake_event.set()
+
     def get_latest_daq_file_name(self):
-        data = self.fetch_data(self.daq_file_params)
+        data = self.fetch_data(self.daq_file_params, 'latest_daq_file_name', extract=extract_first_filename)
+        return self.parse_latest_daq_file_name(data)
+
+    def parse_latest_daq_file_name(self, data):
         if data and 'data' in data and 'result' in data['data']:
             result = data['data']['result']
             if len(result) > 0 and 'metric' in result[0] and 'filename' in result[0]['metric']:
@@ -97,11 +357,67 @@ class DAQWatcher:
                 # print(f'Error fetching DAQ file name, no filename in result: {data}')  # If no logging no file name
                 return None
         else:
-            print(f'Error fetching DAQ file data: {data}')
+            log.error(f'Error fetching DAQ file data: {data}')
         return None
 
     def get_rate(self):
-        data = self.fetch_data(self.rate_params)
+        """
+        Get the DAQ rate over the integration time. In 'rate' mode Prometheus computes the rate and returns a single
+        value. Falls back to the two point slope of the raw l1count samples if that fails.
+        :return: Rate in Hz or None
+        """
+        if self.rate_query_mode == 'rate':
+            rate = self.get_server_rate()
+            if rate is not None:
+                return rate
+        elif self.rate_query_mode == 'incremental':
+            return self.get_incremental_rate()
+        return self.get_range_rate()
+
+    def get_incremental_rate(self):
+        """
+        Fetch only l1count samples newer than the last one seen into the rolling buffer, then compute the rate over
+        the integration time, and the rate_windows, locally.
+        :return: Rate in Hz over the integration time or None
+        """
+        now = time()
+        return self.parse_incremental_rate(self.fetch_data(self.get_incremental_rate_params(now), 'rate'), now)
+
+    def get_incremental_rate_params(self, now):
+        lookback = self.rate_estimator.get_lookback(now)
+        return {'query': f'sphenix_gtm_gl1_json_dump_l1count{{}}[{lookback}s]', 'instant': 'true'}
+
+    def parse_incremental_rate(self, data, now):
+        if data and 'data' in data and 'result' in data['data']:
+            result = data['data']['result']
+            if len(result) > 0:
+                self.rate_estimator.add_samples(result[0]['values'])
+        else:
+            log.error(f'Error fetching rate data, no data or result: {data}')
+        self.rates = self.rate_estimator.get_rates(self.rate_windows, now)
+        return self.rate_estimator.get_rate(self.integration_time, now)
+
+    def get_server_rate(self):
+        return self.parse_server_rate(self.fetch_data(self.server_rate_params, 'rate', extract=extract_single_value))
+
+    def parse_server_rate(self, data):
+        if data and 'data' in data and 'result' in data['data']:
+            result = data['data']['result']
+            if len(result) > 0 and 'value' in result[0]:
+                return float(result[0]['value'][-1])
+        return None
+
+    def parse_server_rate_with_fallback(self, data):
+        rate = self.parse_server_rate(data)
+        return rate if rate is not None else self.get_range_rate()
+
+    def get_range_rate(self):
+        return self.parse_range_rate(self.fetch_data(self.rate_params, 'rate', extract=self.extract_range_rate))
+
+    def extract_range_rate(self, body):
+        return extract_first_last_samples(body, self.required_points)
+
+    def parse_range_rate(self, data):
         if data and 'data' in data and 'result' in data['data']:
             result = data['data']['result']
             if len(result) > 0:
@@ -112,28 +428,84 @@ class DAQWatcher:
                     event_diff = int(last[1]) - int(first[1])
                     return event_diff / time_diff
                 else:
-                    print(f'Error fetching rate data, not enough values: {data}')
+                    log.error(f'Error fetching rate data, not enough values: {data}')
             else:
-                print(f'Error fetching rate data, no results: {data}')
+                log.error(f'Error fetching rate data, no results: {data}')
         else:
-            print(f'Error fetching rate data, no data or result: {data}')
+            log.error(f'Error fetching rate data, no data or result: {data}')
         return None
 
     def get_mvtx_mixed_staves(self):
+        return self.parse_mvtx_query(self.post_query(self.get_mvtx_query_json(), 'mvtx_mixed_staves'))
+
+    def get_mvtx_query_json(self):
+        """
+        Get the MVTX stave query payload. In incremental mode this is a full resync of the latest rows if the
+        resync period has passed, otherwise only rows at or after the watermark.
+        :return: /api/ds/query payload
+        """
+        if not self.mvtx_incremental:
+            return self.mvtx_mixed_staves_json
+        self.mvtx_resyncing = (self.mvtx_watermark is None or self.mvtx_last_resync is None or
+                               time() - self.mvtx_last_resync > self.mvtx_resync_period)
+        return get_mvtx_stave_rows_json(None if self.mvtx_resyncing else self.mvtx_watermark)
+
+    def parse_mvtx_query(self, data):
+        if self.mvtx_incremental:
+            return self.parse_mvtx_stave_rows(data, self.mvtx_resyncing)
+        return self.parse_mvtx_mixed_staves(data)
+
+    def parse_mvtx_stave_rows(self, data, resync):
+        """
+        Merge (DPE, Wert, Zeit, ZeitText) rows into the per-DPE latest value map and sum the values.
+        :param data: /api/ds/query response for a get_mvtx_stave_rows_json payload.
+        :param resync: True if the rows are a full resync, replacing the map.
+        :return: Number of mixed staves, None on failure.
+        """
+        try:
+            frames = data['results']['MVTX Mixed Staves'].get('frames', [])
+            rows = []
+            if len(frames) > 0:
+                names = [field['name'] for field in frames[0]['schema']['fields']]
+                columns = dict(zip(names, frames[0]['data']['values']))
+                rows = list(zip(columns['DPE'], columns['Wert'], columns['Zeit'], columns['ZeitText']))
+        except Exception as e:
+            log.error(f'Error fetching MVTX mixed staves: {e}, {data}')
+            return None
+
+        stave_values = {} if resync else self.mvtx_stave_values
+        for dpe, value, zeit, zeit_text in rows:
+            if dpe not in stave_values or zeit >= stave_values[dpe][0]:
+                stave_values[dpe] = (zeit, value)
+        self.mvtx_stave_values = stave_values
+        if len(rows) > 0:
+            zeit_text = max(rows, key=lambda row: row[2])[3]
+            # Only ever put what looks like a DATETIME into the SQL, otherwise resync next time
+            self.mvtx_watermark = zeit_text if zeit_text_re.fullmatch(str(zeit_text)) else None
+        if resync:
+            self.mvtx_last_resync = time()
+        elif len(rows) >= mvtx_stave_rows_limit:  # Missed rows past the limit, resync next time
+            self.mvtx_last_resync = None
+
+        if len(self.mvtx_stave_values) == 0:
+            return None
+        return sum(value for zeit, value in self.mvtx_stave_values.values())
+
+    def parse_mvtx_mixed_staves(self, data):
+        if data is None:
+            return None
         try:
-            response = requests.post(self.query_url, json=self.mvtx_mixed_staves_json)
-            data = response.json()
             if ('results' in data and len(data['results']) > 0 and 'MVTX Mixed Staves' in data['results'] and
                     len(data['results']['MVTX Mixed Staves']['frames']) > 0):
                 return data['results']['MVTX Mixed Staves']['frames'][0]['data']['values'][0][0]
             else:
-                print(f'Error fetching MVTX mixed staves: {data}')
+                log.error(f'Error fetching MVTX mixed staves: {data}')
         except Exception as e:
-            print(f'Error fetching MVTX mixed staves: {e}')
+            log.error(f'Error fetching MVTX mixed staves: {e}')
         return None
 
     def update_mvtx_om_memory(self):
-        data = self.fetch_data(self.mvtx_om_memory_params)
+        data = self.fetch_data(self.mvtx_om_memory_params, 'mvtx_om_memory')
         if data and 'data' in data and 'result' in data['data']:
             result = data['data']['result']
             for server_result in result:
@@ -141,77 +513,313 @@ class DAQWatcher:
                 timestamp, memory_usage = server_result['value']
                 self.mvtx_server_memory[server_name] = int(memory_usage)
 
+    def get_rate_range(self, start, end, step):
+        """
+        Get the rate history between start and end from Prometheus query_range.
+        :param start: seconds since epoch
+        :param end: seconds since epoch
+        :param step: seconds Time between points.
+        :return: List of (time, rate in Hz) points, empty on failure.
+        """
+        params = {'query': self.server_rate_params['query'], 'start': start, 'end': end, 'step': step}
+        data = self.fetch_data(params, 'rate_range', self.range_endpoint_url)
+        try:
+            result = data['data']['result']
+            if len(result) == 0:
+                return []
+            return [(float(t), float(rate)) for t, rate in result[0]['values']]
+        except Exception as e:
+            log.error(f'Error fetching rate history {start}-{end}: {e}')
+            return []
+
+    def backfill_rate(self, start, end, step, callback, chunk_time=3600, workers=None):
+        """
+        Fetch the rate history between start and end in chunks, in parallel, passing each chunk to callback as it
+        arrives. Chunks may arrive in any order. Blocks until done, so run on its own thread.
+        :param start: seconds since epoch
+        :param end: seconds since epoch
+        :param step: seconds Time between points.
+        :param callback: Function taking a list of (time, rate in Hz) points.
+        :param chunk_time: seconds Time covered by each query_range request.
+        :param workers: Number of chunks to fetch at once, backfill_workers if None. More than that overflows the
+                        connection pool.
+        :return:
+        """
+        workers = workers if workers is not None else self.backfill_workers
+        chunks, chunk_start = [], start
+        while chunk_start < end:
+            chunks.append((chunk_start, min(chunk_start + chunk_time, end)))
+            chunk_start += chunk_time + step  # query_range includes both ends, don't fetch boundary twice
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Backfill') as pool:
+            futures = [pool.submit(self.get_rate_range, chunk_start, chunk_end, step)
+                       for chunk_start, chunk_end in reversed(chunks)]  # Most recent first
+            for future in as_completed(futures):
+                points = future.result()
+                if len(points) > 0:
+                    callback(points)
+
+    def timed_query(self, name):
+        start = perf_counter()
+        try:
+            result = self.cycle_queries[name]()
+        finally:
+            self.query_times[name] = perf_counter() - start
+        if result is None:
+            self.query_stats.record_no_value(name)
+        return result
+
+    def poll_queries(self):
+        """
+        Run all per-cycle queries concurrently. Cycle latency is that of the slowest single query.
+        :return: Dictionary of query name to result, None for any query that failed.
+        """
+        if self.batch_queries:
+            return self.poll_batch()
+        start = perf_counter()
+        futures = {name: self.query_pool.submit(self.timed_query, name) for name in self.cycle_queries}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                log.error(f'Error in {name} query: {e}', extra={'fields': {'query': name}})
+                results[name] = None
+        self.cycle_query_time = perf_counter() - start
+        return results
+
+    def get_batch_rate_query(self, now):
+        """
+        Get the rate query and matching parser for the current rate_query_mode.
+        :param now: seconds since epoch Time of the poll, for the incremental lookback.
+        :return: Query parameters, parser taking the Prometheus style response data.
+        """
+        if self.rate_query_mode == 'rate':
+            return self.server_rate_params, self.parse_server_rate_with_fallback
+        elif self.rate_query_mode == 'incremental':
+            return self.get_incremental_rate_params(now), lambda data: self.parse_incremental_rate(data, now)
+        return self.rate_params, self.parse_range_rate
+
+    def poll_batch(self):
+        """
+        Run all per-cycle queries, Prometheus and MySQL, in one /api/ds/query request with a refId per query. The
+        response frames are converted back to the Prometheus API shape and routed to the usual parsers.
+        :return: Dictionary of query name to result, None for any query that failed.
+        """
+        now = time()
+        rate_params, rate_parser = self.get_batch_rate_query(now)
+        prometheus_queries = {
+            'run_num': (self.run_params, self.parse_run_number),
+            'rate': (rate_params, rate_parser),
+            'latest_daq_file_name': (self.daq_file_params, self.parse_latest_daq_file_name),
+        }
+        payload = get_batch_query_json(self.database_uid, {name: params for name, (params, parser) in
+                                                           prometheus_queries.items()}, self.get_mvtx_query_json())
+        start = perf_counter()
+        data = self.post_query(payload, 'batch')
+        self.cycle_query_time = perf_counter() - start
+        self.query_times = {name: self.cycle_query_time for name in self.cycle_queries}
+
+        results = {}
+        for name, (params, parser) in prometheus_queries.items():
+            try:
+                results[name] = parser(get_prometheus_data_from_frames(data, name))
+            except Exception as e:
+                log.error(f'Error in {name} query: {e}', extra={'fields': {'query': name}})
+                results[name] = None
+        results['mvtx_mixed_staves'] = self.parse_mvtx_query(data)
+        for name, result in results.items():
+            if result is None:
+                self.query_stats.record_no_value(name)
+        return results
+
+    def count_low_rate(self, read_time):
+        """
+        Whether a low rate read counts towards rate_alarm_cushion. When polling faster than check_time, only one read
+        per check_time counts, so the cushion still spans the same time and isn't used up re-reading one scrape.
+        """
+        if self.adaptive_period is not None and self.last_low_rate_count_time is not None and \
+                read_time - self.last_low_rate_count_time < self.check_time * 0.9:
+            return False
+        self.last_low_rate_count_time = read_time
+        return True
+
+    def get_diagnostics(self):
+        """
+        Health of the polling, to tell a slow or failing query from a stopped run.
+        :return: Dictionary of per query stats (see QueryStats.get_stats), the latest query times, and the achieved
+                 cycle period, jitter and skipped ticks in seconds.
+        """
+        check_period, check_period_reason = self.get_check_period_reason()
+        return {
+            'queries': self.query_stats.get_stats(),
+            'cache': self.response_cache.get_stats(),
+            'query_times': dict(self.query_times),
+            'cycle_query_time': self.cycle_query_time,
+            'period': self.scheduler.get_period(),
+            'jitter': self.scheduler.get_jitter(),
+            'skipped_ticks': self.scheduler.skipped_ticks,
+            'check_period': check_period,
+            'check_period_reason': check_period_reason,
+        }
+
     def watch_daq(self):
-        run_time_alert_counter, low_rate_counter, no_run_num_count = 0, 0, 0
-        while True:
-            self.run_num = self.get_run_number()
-            self.rate = self.get_rate()
-            self.latest_daq_file_name = self.get_latest_daq_file_name()
-            mvtx_mixed_staves_read = self.get_mvtx_mixed_staves()
-            new_mixed_staves = mvtx_mixed_staves_read - self.mvtx_mixed_staves \
-                if self.mvtx_mixed_staves is not None and mvtx_mixed_staves_read is not None else 0
-            self.mvtx_mixed_staves = mvtx_mixed_staves_read
-
-            junk = 'junk' in self.latest_daq_file_name.lower() if self.latest_daq_file_name is not None else False
-            new_run = False
-
-            rate_alert, run_time_alert, mvtx_alert = False, False, False
-
-            # print(f'Run: {self.run_num}, Rate: {self.rate}, Silence: {self.silence}, run_time: {self.run_time}, '
-            #       f'run_time_alert_counter: {run_time_alert_counter}')
-
-            if self.rate is None or self.rate >= self.rate_threshold:
-                low_rate_counter = 0
-
-            if self.run_num is not None:
-                no_run_num_count = 0
-                if self.run_num != self.last_run:
-                    self.last_run = self.run_num
+        self.stop_event.clear()
+        if self.subscriber is not None:
+            self.watch_subscription()
+            return
+        self.scheduler.reset()
+        if self.run_tracker is not None:
+            self.run_tracker.start()
+        while not self.stop_event.is_set():
+            self.check_daq()
+            # Fixed cadence, so sleep only the remainder of the period. Cut short by a run transition or stop.
+            self.scheduler.wait(self.get_check_period(), self.wake_event)
+            if self.wake_event.is_set():
+                self.wake_event.clear()
+                self.scheduler.restart()
+        if self.run_tracker is not None:
+            self.run_tracker.stop()
+
+    def get_check_period(self):
+        """
+        :return: seconds Time until the next cycle, check_time unless adaptive polling is on.
+        """
+        return self.get_check_period_reason()[0]
+
+    def get_check_period_reason(self):
+        """
+        :return: seconds Time until the next cycle, and why it was chosen (see AdaptivePeriod.get_period).
+        """
+        if self.adaptive_period is None:
+            return self.check_time, 'check_time'
+        return self.adaptive_period.get_period(self.snapshot, self.check_time, self.run_tracker is not None)
+
+    def watch_subscription(self):
+        """
+        Run the alarms on readings from the publishing watcher as they arrive, instead of polling. If the publisher
+        goes quiet no snapshots are made, so the time since the last check shows the readings are stale.
+        :return:
+        """
+        last_time = None
+        while not self.stop_event.is_set():
+            readings = self.subscriber.get(timeout=self.check_time)
+            # On reconnect the publisher resends its latest readings, skip them if already processed
+            if readings is not None and (last_time is None or readings['time'] > last_time):
+                last_time = readings['time']
+                self.process_readings(readings)
+
+    def stop(self):
+        """
+        Stop watch_daq after the current cycle. Safe to call from any thread or a signal handler.
+        :return:
+        """
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def check_daq(self):
+        """
+        Run one watch cycle: poll all queries, evaluate alarms and send the results to the update callback.
+        :return:
+        """
+        self.process_readings(self.get_readings())
+
+    def get_readings(self):
+        """
+        Poll all queries for one cycle and publish the readings to any subscribers.
+        :return: Dictionary of the poll time, query results, run start time and incremental window rates.
+        """
+        readings = {'time': time(), **self.poll_queries(), 'rates': list(self.rates.items())}
+        readings['run_start'] = self.get_run_start(readings['run_num'])
+        if self.publisher is not None:
+            self.publisher.publish(readings)
+        return readings
+
+    def process_readings(self, readings):
+        """
+        Evaluate alarms on one cycle's readings and send the results to the update callback.
+        :param readings: Dictionary from get_readings, polled here or received from the publishing watcher.
+        :return:
+        """
+        self.run_num = readings['run_num']
+        self.rate = readings['rate']
+        self.latest_daq_file_name = readings['latest_daq_file_name']
+        self.rates = {window: rate for window, rate in readings.get('rates', [])}
+        mvtx_mixed_staves_read = readings['mvtx_mixed_staves']
+        new_mixed_staves = mvtx_mixed_staves_read - self.mvtx_mixed_staves \
+            if self.mvtx_mixed_staves is not None and mvtx_mixed_staves_read is not None else 0
+        self.mvtx_mixed_staves = mvtx_mixed_staves_read
+
+        junk = 'junk' in self.latest_daq_file_name.lower() if self.latest_daq_file_name is not None else False
+        new_run = False
+
+        rate_alert, run_time_alert, mvtx_alert = False, False, False
+
+        # print(f'Run: {self.run_num}, Rate: {self.rate}, Silence: {self.silence}, run_time: {self.run_time}, '
+        #       f'run_time_alert_counter: {self.run_time_alert_counter}')
+
+        if self.rate is None or self.rate >= self.rate_threshold:
+            self.low_rate_counter = 0
+
+        if self.run_num is not None:
+            self.no_run_num_count = 0
+            if self.run_num != self.last_run:
+                self.last_run = self.run_num
+                self.run_start = readings.get('run_start')  # Time of the first run number sample
+                if self.run_start is None:
                     self.run_start = time() - self.start_time_offset  # Set run start time. A bit delayed so adjust.
-                    run_time_alert_counter = 0
-                    # print(f'New run: {self.run_num}')
-                    new_run = True
+                self.run_time_alert_counter = 0
+                # print(f'New run: {self.run_num}')
+                new_run = True
 
-                if self.run_start is None:
-                    self.run_time = None
-                else:
-                    self.run_time = time() - self.run_start
-
-                if self.rate is not None and self.run_num is not None:
-                    if self.rate < self.rate_threshold and self.run_time > self.new_run_cushion:
-                        # print('Low rate')
-                        rate_alert = True
-                        low_rate_counter += 1
-                        if not self.silence and not junk and low_rate_counter >= self.rate_alarm_cushion:
-                            os.system(f'aplay {self.alert_sound_file} > /dev/null 2>&1')
-
-                if self.target_run_time is not None and self.run_time > self.target_run_time * 60:
-                    # print('Target run time reached')
-                    run_time_alert = True
-                    if not self.silence and run_time_alert_counter < 3 and not junk and self.run_time_reminder:
-                        os.system(f'aplay {self.run_end_sound_file} > /dev/null 2>&1')
-                        run_time_alert_counter += 1
-
-                if self.mvtx_mixed_staves is not None and self.mvtx_mixed_staves > self.mvtx_stave_threshold:
+            if self.run_start is None:
+                self.run_time = None
+            else:
+                self.run_time = time() - self.run_start
+
+            if self.rate is not None and self.run_num is not None:
+                if self.rate < self.rate_threshold and self.run_time > self.new_run_cushion:
+                    # print('Low rate')
+                    rate_alert = True
+                    if self.count_low_rate(readings['time']):
+                        self.low_rate_counter += 1
+                    if not self.silence and not junk and self.low_rate_counter >= self.rate_alarm_cushion:
+                        self.sound_player.play(self.alert_sound_file, self.alert_sound_priority)
+
+            if self.target_run_time is not None and self.run_time > self.target_run_time * 60:
+                # print('Target run time reached')
+                run_time_alert = True
+                if not self.silence and self.run_time_alert_counter < 3 and not junk and self.run_time_reminder:
+                    self.sound_player.play(self.run_end_sound_file, self.run_end_sound_priority)
+                    self.run_time_alert_counter += 1
+
+            if self.mvtx_mixed_staves is not None and self.mvtx_mixed_staves > self.mvtx_stave_threshold:
+                mvtx_alert = True
+                if not self.silence and not junk and self.mvtx_alerts:
+                    self.sound_player.play(self.mvtx_alert_sound_file, self.mvtx_alert_sound_priority)
+
+            if new_run:
+                if not self.silence and not junk:
+                    self.sound_player.play(self.run_start_sound_file, self.run_start_sound_priority)
+        else:
+            self.no_run_num_count += 1
+            if self.no_run_num_count == 4:
+                if (self.mvtx_mixed_staves is not None and self.mvtx_mixed_staves > 0 and not self.silence and
+                        self.mvtx_alerts):
+                    self.sound_player.play(self.mvtx_alert_sound_file, self.mvtx_alert_sound_priority)
                     mvtx_alert = True
-                    if not self.silence and not junk and self.mvtx_alerts:
-                        os.system(f'aplay {self.mvtx_alert_sound_file} > /dev/null 2>&1')
 
-                if new_run:
-                    if not self.silence and not junk:
-                        os.system(f'aplay {self.run_start_sound_file} > /dev/null 2>&1')
-            else:
-                no_run_num_count += 1
-                if no_run_num_count == 4:
-                    if self.mvtx_mixed_staves > 0 and not self.silence and self.mvtx_alerts:
-                        os.system(f'aplay {self.mvtx_alert_sound_file} > /dev/null 2>&1')
-                        mvtx_alert = True
-
-            # Update the GUI with the latest data
-            if self.update_callback:
-                self.update_callback(self.run_num, self.rate, self.run_time, self.mvtx_mixed_staves, new_mixed_staves,
-                                     rate_alert, run_time_alert, mvtx_alert, junk, new_run)
-            sleep(self.check_time)  # Do this first so continues are safe
+        snapshot = WatchSnapshot(readings['time'], self.run_num, self.rate, self.run_time, self.mvtx_mixed_staves,
+                                 new_mixed_staves, rate_alert, run_time_alert, mvtx_alert, junk, new_run,
+                                 self.latest_daq_file_name, self.silence)
+        self.snapshot = snapshot
+        if self.adaptive_period is not None:
+            self.adaptive_period.update(snapshot, self.rate_threshold)
+        if self.archive is not None:
+            self.archive.write(snapshot)
+
+        # Publish the latest data. Callback is run on the watcher thread, so must not touch the GUI directly.
+        if self.update_callback:
+            self.update_callback(snapshot)
 
     # def calc_required_points(self):
     #     self.required_points = max(2, int(self.integration_time / self.database_refresh_period * self.frac_max_points))
@@ -225,6 +833,8 @@ class DAQWatcher:
         self._integration_time = int(value)
         # self.calc_required_points()
         self.rate_params = self.get_rate_params()
+        self.server_rate_params = self.get_server_rate_params()
+        self.rate_estimator.max_window = max(self.rate_windows + (self._integration_time,))
 
 
 def get_mvtx_mixed_staves_json():
@@ -242,3 +852,112 @@ def get_mvtx_mixed_staves_json():
         ],
     }
     return payload
+
+
+mvtx_stave_rows_limit = 1000
+zeit_text_re = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?')
+
+
+def get_mvtx_stave_rows_json(watermark=None):
+    """
+    Query for raw MixedStaveCount rows, leaving the per-DPE latest value and sum to DAQWatcher.
+    Without a watermark it returns the latest rows, as the full query does. With one it only returns rows at or after
+    the watermark, which is a cheap range scan on Zeit instead of a sort and group by of the table every poll.
+    Grafana converts Zeit to epoch ms as if it were UTC while FROM_UNIXTIME uses the session time zone, so the
+    watermark is instead Zeit formatted as text on the database (ZeitText), which compares back against the DATETIME
+    column with no time zone conversion either way.
+    :param watermark: ZeitText of the latest row already seen, None for a full resync.
+    :return: /api/ds/query payload
+    """
+    zeit_text = "DATE_FORMAT(Zeit, '%Y-%m-%d %H:%i:%s.%f') AS ZeitText"
+    if watermark is None:
+        sql = (f'SELECT t.DPE, t.Wert, t.Zeit, t.ZeitText FROM ( SELECT DPE, Wert, Zeit, {zeit_text} '
+               f'FROM MixedStaveCount ORDER BY Zeit DESC LIMIT {mvtx_stave_rows_limit} ) AS t ORDER BY t.Zeit ASC;')
+    else:
+        sql = (f"SELECT DPE, Wert, Zeit, {zeit_text} FROM MixedStaveCount WHERE Zeit >= '{watermark}' "
+               f'ORDER BY Zeit ASC LIMIT {mvtx_stave_rows_limit};')
+    payload = {
+        "queries": [
+            {
+                "refId": "MVTX Mixed Staves",
+                "datasource": {
+                    "type": "mysql",
+                    "uid": "iQo4u_fVk"
+                },
+                "rawSql": sql,
+                "format": "table",
+            }
+        ],
+    }
+    return payload
+
+
+def get_batch_query_json(database_uid, prometheus_params, mysql_payload=None, time_range='now-5m'):
+    """
+    Build one /api/ds/query payload holding several Prometheus instant queries and optionally MySQL queries.
+    :param database_uid: Prometheus datasource uid.
+    :param prometheus_params: Dictionary of refId to Prometheus API query parameters ({'query': ...}).
+    :param mysql_payload: /api/ds/query payload whose queries are appended as is, keeping their refIds.
+    :param time_range: Start of the query time range. Instant queries are evaluated at its end, now.
+    :return: Payload dictionary
+    """
+    queries = []
+    for ref_id, params in prometheus_params.items():
+        queries.append({
+            "refId": ref_id,
+            "datasource": {
+                "type": "prometheus",
+                "uid": database_uid
+            },
+            "expr": params['query'],
+            "instant": True,  # /api/v1/query ignores 'instant', so every query is an instant query there too
+            "range": False,
+        })
+    if mysql_payload is not None:
+        queries.extend(mysql_payload['queries'])
+    return {"queries": queries, "from": time_range, "to": "now"}
+
+
+def get_prometheus_data_from_frames(data, ref_id):
+    """
+    Convert the data frames /api/ds/query returns for one Prometheus refId into the /api/v1/query response shape,
+    so the same parsers can handle both. Each frame is one series, its labels are on the value field. Both 'value'
+    (last sample) and 'values' (all samples) are filled since instant vectors and range vectors come back alike.
+    :param data: /api/ds/query response
+    :param ref_id: refId of the query to extract.
+    :return: Prometheus API style response dictionary or None if the query is missing or failed.
+    """
+    if not data or 'results' not in data or ref_id not in data['results']:
+        return None
+    ref_result = data['results'][ref_id]
+    if 'error' in ref_result:
+        log.error(f'Error in batched {ref_id} query: {ref_result["error"]}')
+        return None
+    result = []
+    for frame in ref_result.get('frames', []):
+        fields, values = frame['schema']['fields'], frame['data']['values']
+        if len(fields) < 2 or len(values) < 2:
+            continue
+        metric = dict(fields[1].get('labels') or {})
+        samples = [[t / 1000, prometheus_value_str(v)] for t, v in zip(values[0], values[1])]
+        if len(samples) == 0:
+            continue
+        result.append({'metric': metric, 'value': samples[-1], 'values': samples})
+    return {'status': 'success', 'data': {'result': result}}
+
+
+def get_response_error(response):
+    """
+    :return: HTTPError for an error status response, else None.
+    """
+    if response.ok:
+        return None
+    return requests.exceptions.HTTPError(f'{response.status_code} {response.reason}', response=response)
+
+
+def prometheus_value_str(value):
+    """
+    Prometheus sends sample values as strings and integers without a decimal point. Match that for frame values.
+    """
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
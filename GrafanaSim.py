@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 15:20 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/GrafanaSim
+
+@author: Dylan Neff, dn277127
+"""
+
+import re
+import json
+import random
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timezone
+from threading import Thread, Lock, Event
+from time import time, sleep
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+duration_units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000}
+
+
+class BadData(ValueError):
+    """
+    A query real Prometheus would reject with errorType bad_data.
+    """
+
+
+# Scripted scenarios. Each phase lasts duration seconds. run None is no run, rate in Hz, staves is the number of MVTX
+# staves in a mixed state. latency is added to every response in seconds and hang makes requests never return.
+scenarios = {
+    'steady': [
+        {'duration': 3600, 'run': 50000, 'rate': 3000},
+    ],
+    'beam_abort': [
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+        {'duration': 15, 'run': 50000, 'rate': 100},
+        {'duration': 45, 'run': 50000, 'rate': 0},
+        {'duration': 10, 'run': None, 'rate': 0},
+        {'duration': 120, 'run': 50001, 'rate': 3000},
+    ],
+    'run_transition': [
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+        {'duration': 10, 'run': None, 'rate': 0},
+        {'duration': 60, 'run': 50001, 'rate': 3000},
+        {'duration': 5, 'run': None, 'rate': 0},
+        {'duration': 60, 'run': 50002, 'rate': 3000},
+    ],
+    'junk_run': [
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+        {'duration': 10, 'run': None, 'rate': 0},
+        {'duration': 60, 'run': 50001, 'rate': 50, 'junk': True},
+        {'duration': 10, 'run': None, 'rate': 0},
+        {'duration': 60, 'run': 50002, 'rate': 3000},
+    ],
+    'stave_flip': [
+        {'duration': 30, 'run': 50000, 'rate': 3000, 'staves': 0},
+        {'duration': 30, 'run': 50000, 'rate': 3000, 'staves': 1},
+        {'duration': 30, 'run': 50000, 'rate': 3000, 'staves': 3},
+        {'duration': 30, 'run': 50000, 'rate': 3000, 'staves': 0},
+    ],
+    'slow': [
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+        {'duration': 60, 'run': 50000, 'rate': 3000, 'latency': 2},
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+    ],
+    'hung': [
+        {'duration': 30, 'run': 50000, 'rate': 3000},
+        {'duration': 30, 'run': 50000, 'rate': 0, 'hang': True},
+        {'duration': 60, 'run': 50000, 'rate': 3000},
+    ],
+}
+
+mvtx_hosts = ['mvtx0', 'mvtx1', 'mvtx2', 'mvtx3', 'mvtx4', 'mvtx5']
+n_mvtx_staves = 48
+
+
+class GrafanaSim:
+    def __init__(self, scenario='steady', port=7815, host='localhost', scrape_interval=2, history=3600,
+                 loop=True, rate_noise=0.02, seed=None):
+        """
+        Local stand-in for the Grafana proxy DAQWatcher talks to. Serves the Prometheus /api/v1/query and query_range
+        proxy endpoints and /api/ds/query, for Prometheus and MySQL MixedStaveCount queries, with the response shapes
+        DAQWatcher parses. The data follows a scripted scenario of phases.
+        :param scenario: Name of a built in scenario or list of phase dictionaries.
+        :param port: Port to serve on, 0 for any free port.
+        :param host: Host to serve on.
+        :param scrape_interval: seconds Time between simulated Prometheus samples.
+        :param history: seconds History, in the first phase's state, to generate before the start.
+        :param loop: Repeat the scenario when it ends, else stay in the last phase.
+        :param rate_noise: Relative random variation of the rate between samples.
+        :param seed: Random seed for reproducible data.
+        """
+        self.phases = scenarios[scenario] if isinstance(scenario, str) else scenario
+        self.scenario_time = sum(phase['duration'] for phase in self.phases)
+        self.scrape_interval = scrape_interval
+        self.loop = loop
+        self.rate_noise = rate_noise
+        self.random = random.Random(seed)
+
+        self.start_time = time()
+        self.lock = Lock()
+        self.samples = []  # (time, phase, l1count) at each scrape
+        self.sample_times = []
+        self.stave_rows = []  # (DPE, Wert, Zeit ms) rows of MixedStaveCount
+        self.stave_values = {}
+        self.next_scrape = self.start_time - history
+        self.l1count = 0
+        self.last_run = None  # Last run with a counter
+        self.runs = []  # Runs seen, for file names
+        self.request_count = 0
+        self.stop_event = Event()
+
+        self.server = ThreadingHTTPServer((host, port), self.get_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.name = 'Grafana Sim Thread'
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()  # Release hung requests
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_phase(self, t):
+        elapsed = max(t - self.start_time, 0)
+        if self.loop:
+            elapsed %= self.scenario_time
+        for phase in self.phases:
+            if elapsed < phase['duration']:
+                return phase
+            elapsed -= phase['duration']
+        return self.phases[-1]
+
+    def advance(self, now):
+        """
+        Generate scrapes up to now.
+        """
+        with self.lock:
+            while self.next_scrape <= now:
+                t = self.next_scrape
+                phase = self.get_phase(t)
+                if phase.get('run') is not None and phase['run'] != self.last_run:
+                    self.l1count = 0  # Counter holds between runs and resets at the start of each run
+                    self.last_run = phase['run']
+                    self.runs.append((self.last_run, phase.get('junk', False)))
+                if phase.get('run') is not None:
+                    rate = phase.get('rate', 0) * (1 + self.random.uniform(-self.rate_noise, self.rate_noise))
+                    self.l1count += int(rate * self.scrape_interval)
+                self.samples.append((t, phase, self.l1count))
+                self.sample_times.append(t)
+                self.update_staves(t, phase.get('staves', 0))
+                self.next_scrape += self.scrape_interval
+
+    def update_staves(self, t, n_staves):
+        for stave in range(n_mvtx_staves):
+            dpe = f'mvtx:stave{stave:02d}.mixed'
+            value = 1 if stave < n_staves else 0
+            if self.stave_values.get(dpe) != value:
+                self.stave_values[dpe] = value
+                self.stave_rows.append((dpe, value, int(t * 1000)))
+
+    def get_samples(self, start, end):
+        """
+        Samples with start < time <= end.
+        """
+        first, last = bisect_right(self.sample_times, start), bisect_right(self.sample_times, end)
+        return self.samples[first:last]
+
+    def get_latest(self, t):
+        index = bisect_right(self.sample_times, t) - 1
+        return self.samples[index] if index >= 0 else None
+
+    def get_file_name(self, run, junk):
+        kind = 'junk' if junk else 'physics'
+        return f'/bbox/commissioning/GL1/{kind}/GL1_{kind}_gl1daq-{run:08d}-0000.prdf'
+
+    def evaluate(self, query, t):
+        """
+        Evaluate the PromQL queries DAQWatcher sends at time t.
+        :return: (resultType, result list) in Prometheus API form.
+        """
+        self.advance(t)
+        query = query.strip()
+        window = get_range_window(query)
+        latest = self.get_latest(t)
+        if latest is None or t - latest[0] > 300:  # Prometheus staleness
+            return 'vector', []
+        phase, l1count = latest[1:]
+
+        if 'sphenix_rcdaq_run' in query and window is not None:
+            values = [[s[0], str(s[1]['run'])] for s in self.get_samples(t - window, t) if s[1].get('run') is not None]
+            result = [{'metric': {'__name__': 'sphenix_rcdaq_run', 'hostname': 'gl1daq'}, 'values': values}]
+            return 'matrix', result if len(values) > 0 else []
+        if 'sphenix_rcdaq_run' in query:
+            if phase.get('run') is None:
+                return 'vector', []
+            return 'vector', [{'metric': {'__name__': 'sphenix_rcdaq_run', 'hostname': 'gl1daq'},
+                               'value': [t, str(phase['run'])]}]
+        if query.startswith('rate(sphenix_gtm_gl1_json_dump_l1count'):
+            rate = self.get_rate(t, window)
+            if rate is None:
+                return 'vector', []
+            return 'vector', [{'metric': {}, 'value': [t, repr(rate)]}]
+        if 'sphenix_gtm_gl1_json_dump_l1count' in query:
+            values = [[s[0], str(s[2])] for s in self.get_samples(t - (window or 300), t)]
+            if window is None:
+                return 'vector', [{'metric': {'__name__': 'sphenix_gtm_gl1_json_dump_l1count'},
+                                   'value': [t, str(l1count)]}]
+            return 'matrix', [{'metric': {'__name__': 'sphenix_gtm_gl1_json_dump_l1count'}, 'values': values}]
+        if 'sphenix_rcdaq_file_size_Byte' in query:
+            result = []
+            for run, junk in reversed(self.runs[-20:]):
+                size = l1count * 1000 if run == phase.get('run') else 2 ** 31
+                result.append({'metric': {'run': str(run), 'filename': self.get_file_name(run, junk),
+                                          'hostname': 'gl1daq'}, 'value': [t, str(size)]})
+            return 'vector', result
+        if 'sphenix_rcdaq_root_exe_memory_rss_B' in query:
+            return 'vector', [{'metric': {'hostname': host}, 'value': [t, str(2 ** 30 + i * 2 ** 20)]}
+                              for i, host in enumerate(mvtx_hosts)]
+        return 'vector', []
+
+    def get_rate(self, t, window):
+        samples = self.get_samples(t - window, t)
+        if len(samples) < 2:
+            return None
+        increase, last_count = 0, samples[0][2]
+        for sample_time, phase, count in samples[1:]:
+            increase += count - last_count if count >= last_count else count
+            last_count = count
+        return increase / (samples[-1][0] - samples[0][0])
+
+    def evaluate_range(self, query, start, end, step):
+        values, t = [], start
+        while t <= end:
+            result_type, result = self.evaluate(query, t)
+            if len(result) > 0:
+                values.append([t, result[0]['value'][1]])
+            t += step
+        return [{'metric': {}, 'values': values}] if len(values) > 0 else []
+
+    def evaluate_sql(self, sql, t):
+        """
+        Evaluate the MixedStaveCount queries DAQWatcher sends.
+        :return: Grafana table data frame
+        """
+        self.advance(t)
+        if 'SUM(tt.Wert)' in sql:
+            return {'schema': {'refId': 'MVTX Mixed Staves', 'fields': [{'name': 'MVTX Mixed Staves',
+                                                                          'type': 'number'}]},
+                    'data': {'values': [[sum(self.stave_values.values())]]}}
+        watermark = re.search(r"Zeit >= '([\d\- :.]+)'", sql)
+        limit = re.search(r'LIMIT (\d+)', sql)
+        limit = int(limit.group(1)) if limit else 1000
+        rows = self.stave_rows
+        if watermark:
+            rows = [row for row in rows if get_zeit_text(row[2]) >= watermark.group(1)][:limit]
+        else:
+            rows = rows[-limit:]
+        rows = [row + (get_zeit_text(row[2]),) for row in rows]
+        columns = [list(column) for column in zip(*rows)] if len(rows) > 0 else [[], [], [], []]
+        return {'schema': {'refId': 'MVTX Mixed Staves', 'fields': [{'name': 'DPE', 'type': 'string'},
+                                                                     {'name': 'Wert', 'type': 'number'},
+                                                                     {'name': 'Zeit', 'type': 'time'},
+                                                                     {'name': 'ZeitText', 'type': 'string'}]},
+                'data': {'values': columns}}
+
+    def get_frames(self, query, t):
+        """
+        Evaluate a Prometheus query and return it as Grafana data frames, one per series.
+        """
+        result_type, result = self.evaluate(query, t)
+        frames = []
+        for series in result:
+            samples = series['values'] if 'values' in series else [series['value']]
+            frames.append({'schema': {'fields': [{'name': 'Time', 'type': 'time'},
+                                                 {'name': 'Value', 'type': 'number', 'labels': series['metric']}]},
+                           'data': {'values': [[int(s[0] * 1000) for s in samples], [float(s[1]) for s in samples]]}})
+        return frames
+
+    def delay(self):
+        phase = self.get_phase(time())
+        if phase.get('hang'):
+            self.stop_event.wait(3600)
+        elif phase.get('latency'):
+            sleep(phase['latency'])
+
+    def get_handler(self):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, data, status=200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                sim.request_count += 1
+                sim.delay()
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    if re.fullmatch(r'/api/datasources/proxy/uid/[^/]+/api/v1/query', url.path):
+                        result_type, result = sim.evaluate(params.get('query', ''),
+                                                           float(params.get('time', time())))
+                        self.send_json({'status': 'success', 'data': {'resultType': result_type, 'result': result}})
+                    elif re.fullmatch(r'/api/datasources/proxy/uid/[^/]+/api/v1/query_range', url.path):
+                        result = sim.evaluate_range(params.get('query', ''), float(params['start']),
+                                                    float(params['end']), float(params['step']))
+                        self.send_json({'status': 'success', 'data': {'resultType': 'matrix', 'result': result}})
+                    else:
+                        self.send_json({'message': 'Not found'}, 404)
+                except BadData as e:
+                    self.send_json({'status': 'error', 'errorType': 'bad_data', 'error': str(e)}, 400)
+
+            def do_POST(self):
+                sim.request_count += 1
+                sim.delay()
+                if urlparse(self.path).path != '/api/ds/query':
+                    self.send_json({'message': 'Not found'}, 404)
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                now, results = time(), {}
+                for query in payload.get('queries', []):
+                    try:
+                        if query.get('datasource', {}).get('type') == 'mysql':
+                            frames = [sim.evaluate_sql(query.get('rawSql', ''), now)]
+                        else:
+                            frames = sim.get_frames(query.get('expr', ''), now)
+                    except BadData as e:
+                        results[query['refId']] = {'status': 400, 'error': f'bad_data: {e}'}
+                        continue
+                    results[query['refId']] = {'status': 200, 'frames': frames}
+                self.send_json({'results': results})
+
+        return Handler
+
+
+def get_range_window(query):
+    """
+    Window of the range selector in query, in seconds, None if there isn't one. Raises BadData if the duration isn't
+    valid PromQL, such as [600.0s], as Prometheus would.
+    """
+    range_match = re.search(r'\[([^\]]*)\]', query)
+    if range_match is None:
+        return None
+    duration = range_match.group(1)
+    if not re.fullmatch(r'(\d+(ms|[smhdwy]))+', duration):
+        raise BadData(f'1:{range_match.start() + 2}: parse error: bad duration syntax: "{duration}"')
+    return sum(int(number) * duration_units[unit] for number, unit in re.findall(r'(\d+)(ms|[smhdwy])', duration))
+
+
+def get_zeit_text(zeit):
+    """
+    Zeit ms as MySQL DATE_FORMAT(Zeit, '%Y-%m-%d %H:%i:%s.%f') gives it, taking the simulated database to be on UTC.
+    """
+    return datetime.fromtimestamp(zeit / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Grafana stand-in for DAQ Watch testing')
+    parser.add_argument('--port', type=int, default=7815, help='Port to serve on, same as the ssh forward default')
+    parser.add_argument('--scenario', default='steady',
+                        help=f'Built in scenario ({", ".join(scenarios)}) or path to a JSON list of phases')
+    parser.add_argument('--no-loop', action='store_true', help='Stay in the last phase instead of repeating')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed of the rate noise, for repeatable runs')
+    args = parser.parse_args()
+
+    scenario = args.scenario
+    if scenario not in scenarios:
+        with open(scenario, 'r') as f:
+            scenario = json.load(f)
+    sim = GrafanaSim(scenario, port=args.port, loop=not args.no_loop, seed=args.seed).start()
+    print(f'Serving {args.scenario} scenario at {sim.url}. Run DAQ Watch with: python main.py local')
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
+    print('donzo')
+
+
+if __name__ == '__main__':
+    main()
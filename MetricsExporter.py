@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 17:30 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/MetricsExporter
+
+@author: Dylan Neff, dn277127
+"""
+
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MetricsExporter:
+    def __init__(self, watcher, port, host=''):
+        """
+        Serve what a DAQWatcher observed and alarmed on as Prometheus metrics at /metrics, so the watchers themselves
+        can be scraped. Metrics are rendered from the latest snapshot and query stats when scraped, on the server
+        thread, so the polling path only pays for storing the snapshot.
+        :param watcher: DAQWatcher to export.
+        :param port: Port to serve on, 0 for any free port.
+        :param host: Interface to serve on, all interfaces by default.
+        """
+        self.watcher = watcher
+        self.server = ThreadingHTTPServer((host, port), self.get_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.name = 'Metrics Exporter Thread'
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render(self):
+        """
+        :return: Metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def add(name, metric_type, help_text, samples):
+            lines.append(f'# HELP daq_watch_{name} {help_text}')
+            lines.append(f'# TYPE daq_watch_{name} {metric_type}')
+            for labels, value, *suffix in samples:
+                lines.append(f'daq_watch_{name}{suffix[0] if suffix else ""}{format_labels(labels)} '
+                             f'{format_value(value)}')
+
+        snapshot = self.watcher.snapshot
+        add('up', 'gauge', 'Always 1 while the watcher is serving.', [({}, 1)])
+        if snapshot is not None:
+            add('last_poll_timestamp_seconds', 'gauge', 'Time of the latest watch cycle.', [({}, snapshot.time)])
+            add('run_number', 'gauge', 'Current run number, absent when not running.',
+                [({}, snapshot.run_num)] if snapshot.run_num is not None else [])
+            add('rate_hz', 'gauge', 'DAQ rate over the integration time.',
+                [({}, snapshot.rate)] if snapshot.rate is not None else [])
+            add('run_time_seconds', 'gauge', 'Time since the current run started.',
+                [({}, snapshot.run_time)] if snapshot.run_time is not None else [])
+            add('mvtx_mixed_staves', 'gauge', 'Number of MVTX staves in a mixed state.',
+                [({}, snapshot.mvtx_mixed_staves)] if snapshot.mvtx_mixed_staves is not None else [])
+            add('alert', 'gauge', 'Alarm states of the latest watch cycle.',
+                [({'alert': 'rate'}, snapshot.rate_alert), ({'alert': 'run_time'}, snapshot.run_time_alert),
+                 ({'alert': 'mvtx'}, snapshot.mvtx_alert)])
+            add('junk_run', 'gauge', '1 if the current run is a junk run.', [({}, snapshot.junk)])
+            add('silenced', 'gauge', '1 if alarm sounds are silenced.', [({}, snapshot.silence)])
+        if len(self.watcher.rates) > 0:
+            add('window_rate_hz', 'gauge', 'DAQ rate over extra windows, incremental rate mode only.',
+                [({'window': f'{window:g}'}, rate) for window, rate in sorted(self.watcher.rates.items())
+                 if rate is not None])
+
+        diagnostics = self.watcher.get_diagnostics()
+        queries = diagnostics['queries']
+        histogram = []
+        for name, stats in queries.items():
+            for bound, count in stats['buckets'].items():
+                histogram.append(({'query': name, 'le': format_value(bound)}, count, '_bucket'))
+            histogram.append(({'query': name}, stats['latency_sum'], '_sum'))
+            histogram.append(({'query': name}, stats['count'], '_count'))
+        add('query_duration_seconds', 'histogram', 'Latency of Grafana requests by query.', histogram)
+        add('query_errors_total', 'counter', 'Failed Grafana requests by query and error kind.',
+            [({'query': name, 'kind': kind}, count) for name, stats in queries.items()
+             for kind, count in stats['errors'].items()])
+        add('query_no_value_total', 'counter', 'Cycles where a query gave no value, from an error or empty result.',
+            [({'query': name}, stats['no_value']) for name, stats in queries.items()])
+        add('query_last_success_timestamp_seconds', 'gauge', 'Time of the last successful request by query.',
+            [({'query': name}, stats['last_success']) for name, stats in queries.items()
+             if stats['last_success'] is not None])
+        cache = diagnostics['cache']
+        add('cache_requests_total', 'counter', 'Requests by how the response cache served them.',
+            [({'result': result}, cache[result]) for result in ['hits', 'misses', 'coalesced']])
+        if diagnostics['period'] is not None:
+            add('cycle_period_seconds', 'gauge', 'Mean achieved time between watch cycles.',
+                [({}, diagnostics['period'])])
+        add('check_period_seconds', 'gauge', 'Time until the next watch cycle, by why it was chosen.',
+            [({'reason': diagnostics['check_period_reason']}, diagnostics['check_period'])])
+        add('skipped_ticks_total', 'counter', 'Watch cycles skipped because a cycle overran.',
+            [({}, diagnostics['skipped_ticks'])])
+        return '\n'.join(lines) + '\n'
+
+    def get_handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}'
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if value == float('inf'):
+        return '+Inf'
+    return f'{value:g}' if isinstance(value, float) and value.is_integer() and abs(value) < 1e15 else str(value)
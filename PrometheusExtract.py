@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 19:30 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/PrometheusExtract
+
+@author: Dylan Neff, dn277127
+"""
+
+import re
+import json
+
+
+# Pull only the fields each parser reads out of raw Prometheus API response bytes, instead of decoding the whole body
+# into Python objects. Each extractor returns a minimal response of the same shape as response.json() for the
+# existing parsers, or None if the body isn't what it expects (error, empty result, unusual formatting), in which
+# case the caller decodes the full body as before.
+
+success_re = re.compile(rb'^\s*\{\s*"status"\s*:\s*"success"')
+values_re = re.compile(rb'"values"\s*:\s*\[')
+values_end_re = re.compile(rb'\]\s*\]')
+sample_re = re.compile(rb'\[\s*(-?[0-9.eE+]+)\s*,\s*"([^"]*)"\s*\]')
+value_re = re.compile(rb'"value"\s*:\s*\[\s*(-?[0-9.eE+]+)\s*,\s*"([^"]*)"\s*\]')
+filename_re = re.compile(rb'"filename"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def extract_first_last_samples(body, min_samples=2):
+    """
+    First and last samples of the first series of a range vector, for the two point rate.
+    :param body: Response bytes.
+    :param min_samples: Fewer samples than this gives None, so the full parse reports it.
+    :return: {'data': {'result': [{'values': [first, last]}]}} or None.
+    """
+    if not success_re.match(body):
+        return None
+    values_start = values_re.search(body)
+    if values_start is None:
+        return None
+    values_end = values_end_re.search(body, values_start.end())
+    if values_end is None:
+        return None
+    n_samples = body.count(b'[', values_start.end(), values_end.start() + 1)
+    if n_samples < max(min_samples, 2):
+        return None
+    first = sample_re.search(body, values_start.end(), values_end.end())
+    last = sample_re.match(body, body.rfind(b'[', values_start.end(), values_end.start() + 1))
+    if first is None or last is None:
+        return None
+    values = [[float(sample.group(1)), sample.group(2).decode()] for sample in (first, last)]
+    return {'status': 'success', 'data': {'resultType': 'matrix', 'result': [{'metric': {}, 'values': values}]}}
+
+
+def extract_single_value(body):
+    """
+    Value of an instant vector with exactly one series, such as the run number or a rate().
+    :param body: Response bytes.
+    :return: {'data': {'result': [{'value': [t, value]}]}} or None.
+    """
+    if not success_re.match(body) or body.count(b'"value"') != 1:
+        return None
+    match = value_re.search(body)
+    if match is None:
+        return None
+    return {'status': 'success', 'data': {'resultType': 'vector', 'result': [
+        {'metric': {}, 'value': [float(match.group(1)), match.group(2).decode()]}]}}
+
+
+def extract_first_filename(body):
+    """
+    filename label of the first series, for the latest DAQ file name out of the file size vector of every file.
+    :param body: Response bytes.
+    :return: {'data': {'result': [{'metric': {'filename': name}}]}} or None.
+    """
+    if not success_re.match(body):
+        return None
+    match = filename_re.search(body)
+    if match is None:
+        return None
+    return {'status': 'success', 'data': {'resultType': 'vector', 'result': [
+        {'metric': {'filename': json.loads(b'"' + match.group(1) + b'"')}}]}}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 16:45 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/QueryStats
+
+@author: Dylan Neff, dn277127
+"""
+
+from bisect import bisect_left
+from collections import deque
+from threading import Lock
+from time import time
+
+import requests
+
+
+# seconds Upper bounds of the latency histogram buckets, Prometheus style. The last bucket is everything above.
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class QueryStats:
+    def __init__(self, recent_points=100):
+        """
+        Latency histograms, error counters and last success times for each query. Recording is a bisect and a few
+        increments under a lock, cheap enough to leave on for every request. Safe to use from the query threads.
+        :param recent_points: Number of recent latencies to keep per query for percentiles.
+        """
+        self.recent_points = recent_points
+        self.lock = Lock()
+        self.queries = {}  # query name -> stats dictionary
+
+    def get_query(self, name):
+        if name not in self.queries:
+            self.queries[name] = {
+                'count': 0, 'latency_sum': 0., 'bucket_counts': [0] * (len(latency_buckets) + 1),
+                'recent': deque(maxlen=self.recent_points), 'errors': {}, 'no_value': 0,
+                'last_success': None, 'last_error': None, 'last_error_message': None,
+            }
+        return self.queries[name]
+
+    def record(self, name, latency, error=None):
+        """
+        Record one request.
+        :param name: Query name.
+        :param latency: seconds Time from request to decoded response, or to failure.
+        :param error: Exception the request failed with, None on success.
+        :return:
+        """
+        with self.lock:
+            query = self.get_query(name)
+            query['count'] += 1
+            query['latency_sum'] += latency
+            query['bucket_counts'][bisect_left(latency_buckets, latency)] += 1
+            query['recent'].append(latency)
+            if error is None:
+                query['last_success'] = time()
+            else:
+                kind = get_error_kind(error)
+                query['errors'][kind] = query['errors'].get(kind, 0) + 1
+                query['last_error'] = time()
+                query['last_error_message'] = str(error)
+
+    def record_no_value(self, name):
+        """
+        Record a cycle where the query gave no value, from an error or an empty result such as no run number between
+        runs. Compare with the error count to tell the two apart.
+        """
+        with self.lock:
+            self.get_query(name)['no_value'] += 1
+
+    def get_stats(self):
+        """
+        :return: Dictionary of query name to count, errors, no value count, last success and error times, latency
+                 histogram (cumulative, keyed by bucket upper bound as Prometheus does) and recent percentiles in s.
+        """
+        stats = {}
+        with self.lock:
+            for name, query in self.queries.items():
+                recent = sorted(query['recent'])
+                cumulative, buckets = 0, {}
+                for bound, count in zip(latency_buckets + (float('inf'),), query['bucket_counts']):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                stats[name] = {
+                    'count': query['count'], 'latency_sum': query['latency_sum'], 'buckets': buckets,
+                    'errors': dict(query['errors']), 'error_count': sum(query['errors'].values()),
+                    'no_value': query['no_value'], 'last_success': query['last_success'],
+                    'last_error': query['last_error'], 'last_error_message': query['last_error_message'],
+                    'p50': get_percentile(recent, 50), 'p95': get_percentile(recent, 95),
+                    'max': recent[-1] if len(recent) > 0 else None,
+                }
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.queries.clear()
+
+
+def get_error_kind(error):
+    """
+    Sort a request exception into a short error kind for the counters.
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.exceptions.HTTPError):
+        return 'http'
+    if isinstance(error, ValueError):  # Includes JSON decode errors
+        return 'decode'
+    return 'other'
+
+
+def get_percentile(sorted_values, percent):
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[min(int(percent / 100 * len(sorted_values)), len(sorted_values) - 1)]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 10:30 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/RateEstimator
+
+@author: Dylan Neff, dn277127
+"""
+
+from bisect import bisect_left
+from math import ceil
+
+
+class RateEstimator:
+    def __init__(self, max_window=600):
+        """
+        Rolling buffer of (timestamp, l1count) samples from which the rate over any window up to max_window can be
+        computed locally. Only samples newer than the last one seen need to be fetched.
+        Counts are stored as a running total of increases so counter resets at run boundaries don't give negative or
+        huge rates: a drop in l1count is taken as a reset to zero.
+        :param max_window: seconds Longest window rates will be asked for. Older samples are dropped.
+        """
+        self.max_window = max_window
+        self.times = []  # Sample timestamps, seconds since epoch
+        self.totals = []  # Reset corrected cumulative count at each sample
+        self.start = 0  # Index of oldest live sample. Lists are trimmed in bulk to keep appends cheap.
+        self.last_count = None
+
+    @property
+    def last_time(self):
+        return self.times[-1] if len(self.times) > self.start else None
+
+    def get_lookback(self, now, slack=2):
+        """
+        Range to fetch so that only new samples are requested.
+        :param now: seconds since epoch Current time.
+        :param slack: seconds Extra range to cover scrape delay and clock offsets. Duplicates are dropped on add.
+        :return: Integer seconds to put in the [Ns] range selector.
+        """
+        if self.last_time is None:
+            return int(ceil(self.max_window))
+        return int(max(1, min(ceil(now - self.last_time + slack), ceil(self.max_window))))
+
+    def add_samples(self, values):
+        """
+        Add samples from a Prometheus range vector. Samples not newer than the last one seen are ignored.
+        :param values: List of [timestamp, count] pairs, count may be a string.
+        :return: Number of new samples added.
+        """
+        added = 0
+        for timestamp, count in values:
+            timestamp, count = float(timestamp), int(float(count))
+            if self.last_time is not None and timestamp <= self.last_time:
+                continue
+            if self.last_count is None:
+                total = 0
+            elif count >= self.last_count:
+                total = self.totals[-1] + count - self.last_count
+            else:  # Counter reset, count started again from zero
+                total = self.totals[-1] + count
+            self.times.append(timestamp)
+            self.totals.append(total)
+            self.last_count = count
+            added += 1
+        if added > 0:
+            self.prune()
+        return added
+
+    def prune(self):
+        self.start = bisect_left(self.times, self.times[-1] - self.max_window, self.start)
+        if self.start > len(self.times) // 2:
+            del self.times[:self.start]
+            del self.totals[:self.start]
+            self.start = 0
+
+    def get_rate(self, window, now=None):
+        """
+        Rate over the window ending at the newest sample, from the first and last samples inside the window.
+        :param window: seconds Window to compute rate over.
+        :param now: seconds since epoch If given, return None when the newest sample is older than the window.
+        :return: Rate in Hz or None if fewer than two samples in the window.
+        """
+        last_time = self.last_time
+        if last_time is None or (now is not None and now - last_time > window):
+            return None
+        first = bisect_left(self.times, last_time - window, self.start)
+        if len(self.times) - first < 2:
+            return None
+        time_diff = last_time - self.times[first]
+        return (self.totals[-1] - self.totals[first]) / time_diff
+
+    def get_rates(self, windows, now=None):
+        return {window: self.get_rate(window, now) for window in windows}
+
+    def clear(self):
+        self.times, self.totals, self.start, self.last_count = [], [], 0, None
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 12:10 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/RateHistory
+
+@author: Dylan Neff, dn277127
+"""
+
+from collections import deque
+from math import ceil
+
+import numpy as np
+
+
+class RateHistory:
+    def __init__(self, capacity):
+        """
+        Fixed capacity ring buffer of (time, rate) points with O(1) append, running max/min and zero-copy views of
+        the latest n points. Every point is written twice, at slot and slot + capacity, so any window of the latest
+        points is one contiguous slice of the arrays.
+        :param capacity: Maximum number of points kept. Oldest points are overwritten.
+        """
+        self.capacity = int(capacity)
+        self.times = np.zeros(2 * self.capacity, dtype=np.float64)  # seconds since epoch
+        self.rates = np.zeros(2 * self.capacity, dtype=np.float32)
+        self.count = 0  # Total number of points ever appended
+        self.max_queue = deque()  # (count index, rate) with decreasing rates, front is the running max
+        self.min_queue = deque()  # (count index, rate) with increasing rates, front is the running min
+        self.generation = 0  # Incremented whenever stored points change other than by append, to invalidate caches
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, rate):
+        slot = self.count % self.capacity
+        self.times[slot] = self.times[slot + self.capacity] = time
+        self.rates[slot] = self.rates[slot + self.capacity] = rate
+
+        while len(self.max_queue) > 0 and self.max_queue[-1][1] <= rate:
+            self.max_queue.pop()
+        self.max_queue.append((self.count, rate))
+        while len(self.min_queue) > 0 and self.min_queue[-1][1] >= rate:
+            self.min_queue.pop()
+        self.min_queue.append((self.count, rate))
+
+        self.count += 1
+        oldest = self.count - self.capacity
+        if self.max_queue[0][0] < oldest:
+            self.max_queue.popleft()
+        if self.min_queue[0][0] < oldest:
+            self.min_queue.popleft()
+
+    def extend(self, times, rates):
+        """
+        Replace the stored points with the given ones, in bulk. Keeps only the latest capacity points.
+        :param times: Array of times, in increasing order.
+        :param rates: Array of rates.
+        :return:
+        """
+        times, rates = np.asarray(times)[-self.capacity:], np.asarray(rates)[-self.capacity:]
+        n = len(times)
+        self.count = n
+        self.times[:n] = self.times[self.capacity:self.capacity + n] = times
+        self.rates[:n] = self.rates[self.capacity:self.capacity + n] = rates
+
+        # Running max queue is the points greater than every later point, running min those less than every later
+        self.max_queue.clear()
+        self.min_queue.clear()
+        if n > 0:
+            later_max = np.append(np.maximum.accumulate(rates[::-1])[::-1][1:], -np.inf)
+            later_min = np.append(np.minimum.accumulate(rates[::-1])[::-1][1:], np.inf)
+            self.max_queue.extend((i, float(rates[i])) for i in np.nonzero(rates > later_max)[0])
+            self.min_queue.extend((i, float(rates[i])) for i in np.nonzero(rates < later_min)[0])
+        self.generation += 1
+
+    def merge(self, times, rates):
+        """
+        Merge points, possibly older than or interleaved with the stored ones, keeping time order. Points at the same
+        time as a stored point are dropped.
+        :param times: Array of times.
+        :param rates: Array of rates.
+        :return:
+        """
+        stored_times, stored_rates = self.get_window()
+        times = np.asarray(times, dtype=np.float64)
+        keep = ~np.isin(times, stored_times)
+        all_times = np.concatenate([stored_times, times[keep]])
+        all_rates = np.concatenate([stored_rates, np.asarray(rates, dtype=np.float32)[keep]])
+        order = np.argsort(all_times, kind='stable')
+        self.extend(all_times[order], all_rates[order])
+
+    def get_window(self, n=None):
+        """
+        Get the latest n points, oldest first. The arrays are views into the buffer, copy them if they need to
+        outlive the next append.
+        :param n: Number of points, all stored points if None.
+        :return: times, rates arrays
+        """
+        n = len(self) if n is None else max(0, min(int(n), len(self)))
+        end = (self.count - 1) % self.capacity + self.capacity + 1 if self.count > 0 else self.capacity
+        return self.times[end - n:end], self.rates[end - n:end]
+
+    def max(self):
+        return self.max_queue[0][1] if len(self.max_queue) > 0 else None
+
+    def min(self):
+        return self.min_queue[0][1] if len(self.min_queue) > 0 else None
+
+    def clear(self):
+        self.count = 0
+        self.generation += 1
+        self.max_queue.clear()
+        self.min_queue.clear()
+
+
+class MinMaxDecimator:
+    def __init__(self):
+        """
+        Reduce a window of a RateHistory to the min and max point of each of a fixed number of buckets, so short rate
+        dips stay visible when many more points than pixels are plotted. Buckets are aligned to the absolute point
+        index, so complete buckets don't change as new points arrive and their results are cached. Only new complete
+        buckets and the partial buckets at the window edges are computed on each call.
+        """
+        self.bucket_size = None
+        self.generation = None
+        self.first_bucket = None  # Absolute bucket number of the first cached bucket
+        self.indices = np.empty(0, dtype=np.int64)  # Absolute indices of min and max of cached buckets, in order
+
+    def reset(self, bucket_size, generation):
+        self.bucket_size, self.generation = bucket_size, generation
+        self.first_bucket = None
+        self.indices = np.empty(0, dtype=np.int64)
+
+    def decimate(self, history, n, n_buckets):
+        """
+        Get the latest n points of history, decimated to at most about 2 * n_buckets points.
+        :param history: RateHistory
+        :param n: Number of latest points to take.
+        :param n_buckets: Number of buckets, roughly half the pixel width of the plot.
+        :return: times, rates arrays
+        """
+        n = min(int(n), len(history))
+        times, rates = history.get_window(n)
+        if n <= 2 * n_buckets:
+            return times, rates
+        bucket_size = int(ceil(n / n_buckets))
+        start, end = history.count - n, history.count
+        first_full = -(-start // bucket_size)  # First bucket starting inside the window
+        last_full = end // bucket_size - 1  # Last bucket ending inside the window
+        if (bucket_size != self.bucket_size or history.generation != self.generation or
+                (self.first_bucket is not None and first_full < self.first_bucket)):
+            self.reset(bucket_size, history.generation)
+
+        if self.first_bucket is None:
+            self.first_bucket = first_full
+        elif self.first_bucket < first_full:  # Drop buckets which have left the window
+            self.indices = self.indices[2 * (first_full - self.first_bucket):]
+            self.first_bucket = first_full
+        next_bucket = self.first_bucket + len(self.indices) // 2
+
+        if next_bucket <= last_full:
+            seg_start, seg_end = next_bucket * bucket_size, (last_full + 1) * bucket_size
+            self.indices = np.concatenate([self.indices, self.min_max_indices(rates, start, seg_start, seg_end)])
+
+        head_end = min(first_full * bucket_size, end)
+        tail_start = max((last_full + 1) * bucket_size, head_end)
+        indices = np.concatenate([self.min_max_indices(rates, start, start, head_end), self.indices,
+                                  self.min_max_indices(rates, start, tail_start, end)])
+        return times[indices - start], rates[indices - start]
+
+    def min_max_indices(self, rates, window_start, seg_start, seg_end):
+        """
+        Absolute indices of the min and max, in time order, of each bucket in [seg_start, seg_end). A segment shorter
+        than one bucket is treated as one bucket.
+        """
+        if seg_end <= seg_start:
+            return np.empty(0, dtype=np.int64)
+        bucket_size = min(self.bucket_size, seg_end - seg_start)
+        seg = rates[seg_start - window_start:seg_end - window_start].reshape(-1, bucket_size)
+        base = seg_start + np.arange(seg.shape[0], dtype=np.int64) * bucket_size
+        pairs = np.stack([base + seg.argmin(axis=1), base + seg.argmax(axis=1)], axis=1)
+        return np.sort(pairs, axis=1).ravel()
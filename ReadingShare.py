@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 18:05 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/ReadingShare
+
+@author: Dylan Neff, dn277127
+"""
+
+import json
+import socket
+import logging
+from threading import Thread, Lock, Event
+from queue import Queue, Full, Empty
+
+
+log = logging.getLogger(__name__)
+
+
+class ReadingPublisher:
+    def __init__(self, address, send_timeout=1, max_buffer=10):
+        """
+        Send each cycle's readings from the one polling DAQWatcher to any number of subscribers over TCP, as lines of
+        JSON. New subscribers get the latest readings straight away. Each subscriber is sent to from its own thread,
+        so publishing only queues the line. A subscriber which falls max_buffer readings behind, or can't take a line
+        within send_timeout, is dropped rather than holding up the poller.
+        :param address: 'host:port' to listen on. localhost for this machine only, empty host (':port') for all
+                        interfaces. Port 0 for any free port.
+        :param send_timeout: seconds Time to wait on a subscriber's socket before dropping it.
+        :param max_buffer: Readings to hold for a subscriber before dropping it.
+        """
+        self.send_timeout = send_timeout
+        self.max_buffer = max_buffer
+        host, port = address.rsplit(':', 1)
+        self.server = socket.create_server((host, int(port)))
+        self.clients = []
+        self.lock = Lock()
+        self.latest = None  # Encoded latest readings, for new subscribers
+
+        self.thread = Thread(target=self.accept_clients)
+        self.thread.daemon = True
+        self.thread.name = 'Reading Publisher Thread'
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.getsockname()[1]
+
+    def accept_clients(self):
+        while True:
+            try:
+                client, address = self.server.accept()
+            except OSError:
+                return  # Closed
+            client.settimeout(self.send_timeout)
+            sender = ClientSender(client, self.max_buffer)
+            with self.lock:
+                if self.latest is not None:
+                    sender.put(self.latest)
+                self.clients.append(sender)
+
+    def publish(self, readings):
+        """
+        Send readings to all subscribers.
+        :param readings: JSON serializable dictionary.
+        :return:
+        """
+        line = (json.dumps(readings) + '\n').encode()
+        with self.lock:
+            self.latest = line
+            self.clients = [client for client in self.clients if client.put(line)]
+
+    def get_subscriber_count(self):
+        with self.lock:
+            return sum(not client.closed for client in self.clients)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+class ClientSender:
+    def __init__(self, client, max_buffer):
+        """
+        Send queued lines to one subscriber's socket on its own thread, closing it on any error.
+        """
+        self.client = client
+        self.queue = Queue(maxsize=max_buffer)
+        self.closed = False
+
+        self.thread = Thread(target=self.send_lines)
+        self.thread.daemon = True
+        self.thread.name = 'Reading Sender Thread'
+        self.thread.start()
+
+    def put(self, line):
+        """
+        Queue a line to send without blocking.
+        :return: False if the subscriber is closed or too far behind, and has been dropped.
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(line)
+            return True
+        except Full:
+            self.close()
+            return False
+
+    def send_lines(self):
+        while not self.closed:
+            line = self.queue.get()
+            if line is None:
+                return
+            try:
+                self.client.sendall(line)
+            except OSError:
+                self.close()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)  # Wakes a sendall blocked on the socket
+        except OSError:
+            pass
+        self.client.close()
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            pass
+
+
+class ReadingSubscriber:
+    def __init__(self, address, reconnect_time=2, max_queue=100, read_timeout=30):
+        """
+        Receive readings from a ReadingPublisher, reconnecting whenever the connection is lost.
+        :param address: 'host:port' of the publisher.
+        :param reconnect_time: seconds Time between connection attempts.
+        :param max_queue: Readings to hold if not taken, oldest are dropped beyond this.
+        :param read_timeout: seconds Reconnect if no readings arrive for this long, so a connection left half open by
+                             a lost publisher host isn't waited on forever. Should be a few publisher cycles.
+        """
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.reconnect_time = reconnect_time
+        self.read_timeout = read_timeout
+        self.queue = Queue(maxsize=max_queue)
+        self.connected = False
+        self.stop_event = Event()
+
+        self.thread = Thread(target=self.receive)
+        self.thread.daemon = True
+        self.thread.name = 'Reading Subscriber Thread'
+        self.thread.start()
+
+    def receive(self):
+        while not self.stop_event.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=self.reconnect_time) as connection:
+                    connection.settimeout(self.read_timeout)
+                    self.connected = True
+                    for line in connection.makefile('rb'):
+                        self.put(json.loads(line))
+            except (OSError, ValueError) as e:
+                if self.connected:
+                    log.warning(f'Lost connection to reading publisher at {self.address}: {e}')
+            self.connected = False
+            self.stop_event.wait(self.reconnect_time)
+
+    def put(self, readings):
+        while True:
+            try:
+                self.queue.put_nowait(readings)
+                return
+            except Full:
+                try:
+                    self.queue.get_nowait()  # Drop the oldest
+                except Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Get the next readings, in order.
+        :param timeout: seconds Time to wait for readings.
+        :return: Readings dictionary, None if none arrived within timeout.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self.stop_event.set()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 18:40 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/ResponseCache
+
+@author: Dylan Neff, dn277127
+"""
+
+import json
+from collections import OrderedDict
+from threading import Lock, Event
+from time import monotonic
+
+
+# seconds Default time to keep each query's responses. Kept under the poll period for the per-cycle queries so every
+# cycle still gets fresh data, the cache only joins up overlapping requests within a cycle.
+default_ttls = {
+    'run_num': 0.25,
+    'rate': 0.25,
+    'latest_daq_file_name': 0.25,
+    'mvtx_mixed_staves': 0.25,
+    'mvtx_om_memory': 10,
+    'rate_range': 300,
+}
+
+
+class ResponseCache:
+    def __init__(self, ttls=None, max_entries=64):
+        """
+        Cache decoded Grafana responses by request for a time set per query, evicting the least recently used beyond
+        max_entries. Concurrent identical requests are coalesced into one: the first caller fetches while the others
+        wait for its result. Failed requests (None) are not cached.
+        :param ttls: Dictionary of query name to seconds to cache its responses, updating default_ttls. Queries not
+                     listed, or with a TTL of 0, are only coalesced.
+        :param max_entries: Maximum number of cached responses.
+        """
+        self.ttls = {**default_ttls, **(ttls or {})}
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (monotonic time, response)
+        self.in_flight = {}  # key -> Flight
+        self.lock = Lock()
+        self.hits, self.misses, self.coalesced = 0, 0, 0
+
+    def get(self, key, name, fetch):
+        """
+        Get the response for key from the cache, from an identical request in flight, or by calling fetch.
+        :param key: Hashable key of the request, see get_request_key.
+        :param name: Query name, for its TTL.
+        :param fetch: Function making the request, returning the decoded response or None on failure.
+        :return: Decoded response or None.
+        """
+        ttl = self.ttls.get(name, 0)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and monotonic() - entry[0] < ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            return flight.response
+
+        response = None
+        try:
+            response = fetch()
+        finally:
+            with self.lock:
+                if response is not None and ttl > 0:
+                    self.entries[key] = (monotonic(), response)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+                del self.in_flight[key]
+            flight.response = response
+            flight.done.set()
+        return response
+
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                    'entries': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class Flight:
+    def __init__(self):
+        self.done = Event()
+        self.response = None
+
+
+def get_request_key(url, params=None, payload=None):
+    """
+    Hashable key of a request, the same for equal parameters or payload in any order.
+    """
+    return url, json.dumps(params, sort_keys=True), json.dumps(payload, sort_keys=True)
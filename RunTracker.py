@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 20:15 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/RunTracker
+
+@author: Dylan Neff, dn277127
+"""
+
+from threading import Thread, Lock, Event
+
+
+class RunTracker:
+    def __init__(self, get_run_number, period=0.5, on_change=None):
+        """
+        Poll the cheap run number query on its own thread, faster than the watch cycle, so run transitions are seen
+        within period instead of at the next cycle.
+        :param get_run_number: Function querying the current run number, None if not running or on failure.
+        :param period: seconds Time between run number polls.
+        :param on_change: Function called with the new run number when it changes, on the tracker thread.
+        """
+        self.get_run_number_query = get_run_number
+        self.period = period
+        self.on_change = on_change
+        self.run_num = None
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Poll once, so the run number is known straight away, then keep polling on the tracker thread.
+        :return: self
+        """
+        self.stop_event.clear()
+        self.poll()
+        self.thread = Thread(target=self.track)
+        self.thread.daemon = True
+        self.thread.name = 'Run Tracker Thread'
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def track(self):
+        while not self.stop_event.wait(self.period):
+            run_num, changed = self.poll()
+            if changed and self.on_change is not None:
+                self.on_change(run_num)
+
+    def poll(self):
+        """
+        :return: Latest run number, True if it changed since the last poll.
+        """
+        run_num = self.get_run_number_query()
+        with self.lock:
+            changed = run_num != self.run_num
+            self.run_num = run_num
+        return run_num, changed
+
+    def get_run_number(self):
+        """
+        :return: Run number from the latest poll, at most period old.
+        """
+        with self.lock:
+            return self.run_num
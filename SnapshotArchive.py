@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 13:20 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/SnapshotArchive
+
+@author: Dylan Neff, dn277127
+"""
+
+import os
+import struct
+import logging
+from queue import Queue, Empty
+from threading import Thread
+from time import gmtime, strftime, monotonic
+
+# Fixed width little endian record per watch cycle. None is stored as -1 for integers and NaN for floats.
+# time, run_num, rate, run_time, mvtx_mixed_staves, mvtx_new_mixed_staves, flags, daq_file_name
+record_struct = struct.Struct('<diffhhB64s')
+flag_names = ['rate_alert', 'run_time_alert', 'mvtx_alert', 'junk', 'new_run', 'silence']
+file_prefix = 'daq_watch_v1_'
+file_suffix = '.bin'
+log = logging.getLogger(__name__)
+
+
+class SnapshotArchiveWriter:
+    def __init__(self, archive_dir, fsync_period=5, max_days=30):
+        """
+        Append every watch snapshot to a fixed width binary archive, one file per UTC day. Writing is done on a
+        background thread, records are written in batches and fsynced at most every fsync_period seconds. Day files
+        older than max_days are deleted whenever a new day file is opened.
+        :param archive_dir: Directory to write archive files to. Created if it doesn't exist.
+        :param fsync_period: seconds Time between fsyncs. Records since the last fsync may be lost on power failure.
+        :param max_days: Number of day files to keep, including the current one. None to keep all.
+        """
+        self.archive_dir = archive_dir
+        self.fsync_period = fsync_period
+        self.max_days = max_days
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.queue = Queue()
+        self.file = None
+        self.file_path = None
+        self.last_fsync = monotonic()
+
+        self.writer_thread = Thread(target=self.write_queue)
+        self.writer_thread.daemon = True
+        self.writer_thread.name = 'Archive Thread'
+        self.writer_thread.start()
+
+    def write(self, snapshot):
+        """
+        Queue a snapshot to be archived. Returns immediately.
+        :param snapshot: WatchSnapshot
+        :return:
+        """
+        self.queue.put(snapshot)
+
+    def write_queue(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            for snapshot in batch:  # One bad snapshot mustn't lose the rest of the batch
+                try:
+                    self.get_file(snapshot.time).write(pack_snapshot(snapshot))
+                except Exception as e:
+                    log.error(f'Error writing snapshot archive record: {e}')
+            if self.file is None:
+                continue
+            try:
+                self.file.flush()
+                if monotonic() - self.last_fsync > self.fsync_period:
+                    os.fsync(self.file.fileno())
+                    self.last_fsync = monotonic()
+            except Exception as e:
+                log.error(f'Error writing snapshot archive: {e}')
+
+    def get_file(self, time):
+        path = get_archive_path(self.archive_dir, time)
+        if path != self.file_path:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+            self.file = open(path, 'ab')
+            self.file_path = path
+            self.prune(time)
+        return self.file
+
+    def prune(self, time):
+        """
+        Delete day files more than max_days before the day of time.
+        :param time: seconds since epoch Time of the record being written.
+        :return:
+        """
+        if self.max_days is None:
+            return
+        oldest_day = strftime('%Y%m%d', gmtime(time - (self.max_days - 1) * 86400))
+        for file_name in os.listdir(self.archive_dir):
+            if not (file_name.startswith(file_prefix) and file_name.endswith(file_suffix)):
+                continue
+            if file_name[len(file_prefix):-len(file_suffix)] < oldest_day:
+                try:
+                    os.remove(os.path.join(self.archive_dir, file_name))
+                except OSError as e:
+                    log.error(f'Error pruning snapshot archive file {file_name}: {e}')
+
+
+def get_archive_path(archive_dir, time):
+    return os.path.join(archive_dir, f'{file_prefix}{strftime("%Y%m%d", gmtime(time))}{file_suffix}')
+
+
+def pack_snapshot(snapshot):
+    flags = 0
+    for bit, name in enumerate(flag_names):
+        if getattr(snapshot, name):
+            flags |= 1 << bit
+    file_name = (snapshot.daq_file_name or '').encode('utf-8', 'replace')[-64:]  # End of path is most informative
+    return record_struct.pack(snapshot.time, none_to(snapshot.run_num, -1), none_to(snapshot.rate, float('nan')),
+                              none_to(snapshot.run_time, float('nan')), to_int16(snapshot.mvtx_mixed_staves, -1),
+                              to_int16(snapshot.mvtx_new_mixed_staves, 0), flags, file_name)
+
+
+def none_to(value, default):
+    return default if value is None else value
+
+
+def to_int16(value, default):
+    """
+    Stave counts may come back from Grafana as floats, round and clamp them to the int16 field.
+    """
+    if value is None:
+        return default
+    return max(-2 ** 15, min(2 ** 15 - 1, int(round(value))))
+
+
+def get_archive_dtype():
+    import numpy as np  # Only needed to read the archive, keep the writer free of it for the headless watcher
+    return np.dtype([('time', '<f8'), ('run_num', '<i4'), ('rate', '<f4'), ('run_time', '<f4'),
+                     ('mvtx_mixed_staves', '<i2'), ('mvtx_new_mixed_staves', '<i2'), ('flags', 'u1'),
+                     ('daq_file_name', 'S64')])
+
+
+def read_archive(archive_dir, since=None, until=None):
+    """
+    Memory map the archive files covering [since, until]. Nothing is read from disk until the records are used, so
+    opening a week of history is instant.
+    :param archive_dir: Directory holding archive files.
+    :param since: seconds since epoch Earliest time wanted, None for all.
+    :param until: seconds since epoch Latest time wanted, None for all.
+    :return: List of memory mapped record arrays, one per day file, oldest first.
+    """
+    import numpy as np
+    dtype = get_archive_dtype()
+    assert dtype.itemsize == record_struct.size
+    if not os.path.isdir(archive_dir):
+        return []
+    first_day = None if since is None else strftime('%Y%m%d', gmtime(since))
+    last_day = None if until is None else strftime('%Y%m%d', gmtime(until))
+    records = []
+    for file_name in sorted(os.listdir(archive_dir)):
+        if not (file_name.startswith(file_prefix) and file_name.endswith(file_suffix)):
+            continue
+        day = file_name[len(file_prefix):-len(file_suffix)]
+        if (first_day is not None and day < first_day) or (last_day is not None and day > last_day):
+            continue
+        path = os.path.join(archive_dir, file_name)
+        n_records = os.path.getsize(path) // dtype.itemsize  # Ignore a partly written last record
+        if n_records > 0:
+            records.append(np.memmap(path, dtype=dtype, mode='r', shape=(n_records,)))
+    return records
+
+
+def read_archive_rates(archive_dir, since=None, until=None):
+    """
+    Get the time and rate of every archived snapshot with a rate in [since, until].
+    :return: times (epoch seconds), rates (Hz) arrays
+    """
+    import numpy as np
+    times, rates = [], []
+    for day_records in read_archive(archive_dir, since, until):
+        day_times, day_rates = day_records['time'], day_records['rate']
+        mask = ~np.isnan(day_rates)
+        if since is not None:
+            mask &= day_times >= since
+        if until is not None:
+            mask &= day_times <= until
+        times.append(day_times[mask])
+        rates.append(day_rates[mask])
+    if len(times) == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+    return np.concatenate(times), np.concatenate(rates)
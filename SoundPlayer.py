@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 09:40 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/SoundPlayer
+
+@author: Dylan Neff, dn277127
+"""
+
+import wave
+import logging
+import subprocess
+from queue import PriorityQueue
+from threading import Thread, Lock
+from itertools import count
+
+
+log = logging.getLogger(__name__)
+
+
+class SoundPlayer:
+    def __init__(self, backend=None):
+        """
+        Play alarm sounds from a dedicated worker thread so callers never block on playback.
+        Sounds are decoded once and kept in memory. Requests are served highest priority (lowest number) first and a
+        sound already waiting in the queue or playing is not queued again, so an alarm re-requested every cycle while
+        it plays doesn't hold lower priority sounds back for as long as it lasts.
+        :param backend: Object with a play(sound) method, AplayBackend if None.
+        """
+        self.backend = backend if backend is not None else AplayBackend()
+        self.sounds = {}  # path -> DecodedSound
+        self.queue = PriorityQueue()
+        self.pending = set()  # Paths waiting in the queue, for de-duplication
+        self.playing = None  # Path being played, for de-duplication
+        self.lock = Lock()
+        self.counter = count()  # Tie breaker so equal priorities play in request order
+
+        self.worker = Thread(target=self.play_queue)
+        self.worker.daemon = True
+        self.worker.name = 'Sound Thread'
+        self.worker.start()
+
+    def play(self, path, priority=0):
+        """
+        Queue a sound to be played. Returns immediately.
+        :param path: Path to wav file.
+        :param priority: Lower numbers are played first.
+        :return: True if queued, False if the same sound was already waiting or playing.
+        """
+        with self.lock:
+            if path in self.pending or path == self.playing:
+                return False
+            self.pending.add(path)
+        self.queue.put((priority, next(self.counter), path))
+        return True
+
+    def preload(self, paths):
+        for path in paths:
+            self.get_sound(path)
+
+    def get_sound(self, path):
+        """
+        Decode a wav file on first use and cache it.
+        :param path: Path to wav file.
+        :return: DecodedSound or None if the file could not be read.
+        """
+        if path not in self.sounds:
+            try:
+                self.sounds[path] = DecodedSound(path)
+            except Exception as e:
+                log.error(f'Error loading sound file {path}: {e}')
+                return None
+        return self.sounds[path]
+
+    def play_queue(self):
+        while True:
+            priority, _, path = self.queue.get()
+            with self.lock:
+                self.pending.discard(path)
+                self.playing = path
+            try:
+                sound = self.get_sound(path)
+                if sound is not None:
+                    self.backend.play(sound)
+            except Exception as e:
+                log.error(f'Error playing sound {path}: {e}')
+            finally:
+                with self.lock:
+                    self.playing = None
+
+
+class DecodedSound:
+    def __init__(self, path):
+        self.path = path
+        with wave.open(path, 'rb') as wav:
+            self.channels = wav.getnchannels()
+            self.sample_width = wav.getsampwidth()
+            self.frame_rate = wav.getframerate()
+            self.frames = wav.readframes(wav.getnframes())
+
+    @property
+    def duration(self):
+        return len(self.frames) / (self.channels * self.sample_width * self.frame_rate)
+
+
+class AplayBackend:
+    formats = {1: 'U8', 2: 'S16_LE', 3: 'S24_3LE', 4: 'S32_LE'}
+
+    def play(self, sound):
+        """
+        Pipe the decoded PCM frames to aplay. Blocks until playback finishes, only call from the sound worker.
+        :param sound: DecodedSound to play.
+        :return:
+        """
+        cmd = ['aplay', '-q', '-t', 'raw', '-f', self.formats[sound.sample_width], '-c', str(sound.channels),
+               '-r', str(sound.frame_rate), '-']
+        subprocess.run(cmd, input=sound.frames, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class NullBackend:
+    def __init__(self):
+        """
+        Backend which plays nothing, only records what would have been played. For testing without audio.
+        """
+        self.played = []
+
+    def play(self, sound):
+        self.played.append(sound.path)
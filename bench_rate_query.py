@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 10:05 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/bench_rate_query
+
+@author: Dylan Neff, dn277127
+"""
+
+import sys
+import json
+from time import perf_counter
+
+from DAQWatcher import DAQWatcher
+from SoundPlayer import NullBackend
+
+
+def main():
+    grafana_url = 'http://insight.sphenix.bnl.gov:3000'
+    if len(sys.argv) > 1 and sys.argv[1].lower() in ['local', 'l']:
+        grafana_url = 'http://localhost:7815'  # For running through forwarded ssh port
+    elif len(sys.argv) > 1:
+        grafana_url = sys.argv[1]
+    results = bench_rate_query(grafana_url)
+    print_results(results)
+    print(json.dumps(results))
+    print('donzo')
+
+
+def bench_rate_query(grafana_url, integration_times=(10, 30, 60, 120, 300, 600), repeats=10):
+    """
+    Compare payload size and latency of the raw range vector rate query against the server-side rate() query.
+    :param grafana_url: Grafana url to query through.
+    :param integration_times: Integration times in seconds to test.
+    :param repeats: Number of queries per mode and integration time.
+    :return: List of result dictionaries, one per mode and integration time.
+    """
+    watcher = DAQWatcher(grafana_url=grafana_url, sound_backend=NullBackend())
+    results = []
+    for integration_time in integration_times:
+        watcher.integration_time = integration_time
+        for mode, params in [('range', watcher.rate_params), ('rate', watcher.server_rate_params)]:
+            latencies, payload_bytes = [], None
+            for i in range(repeats):
+                start = perf_counter()
+                response = watcher.session.get(watcher.endpoint_url, params=params, timeout=watcher.timeout)
+                response.json()
+                latencies.append(perf_counter() - start)
+                payload_bytes = len(response.content)
+            latencies.sort()
+            results.append({'mode': mode, 'integration_time': integration_time, 'payload_bytes': payload_bytes,
+                            'latency_median': latencies[len(latencies) // 2], 'latency_max': latencies[-1]})
+    return results
+
+
+def print_results(results):
+    print(f'{"Mode":<6} {"Int (s)":>8} {"Payload (B)":>12} {"Median (ms)":>12} {"Max (ms)":>10}')
+    for res in results:
+        print(f'{res["mode"]:<6} {res["integration_time"]:>8} {res["payload_bytes"]:>12} '
+              f'{res["latency_median"] * 1000:>12.1f} {res["latency_max"] * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 16:10 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/benchmark
+
+@author: Dylan Neff, dn277127
+"""
+
+import os
+import gc
+import sys
+import json
+import socket
+import argparse
+import subprocess
+import tracemalloc
+import requests
+from collections import deque
+from time import perf_counter, time, sleep
+
+import DAQWatcher as watcher_module
+from DAQWatcher import DAQWatcher
+from DAQWatchGUI import DAQWatchGUI
+from SoundPlayer import NullBackend
+from RateHistory import RateHistory, MinMaxDecimator
+from PrometheusExtract import extract_first_last_samples, extract_first_filename
+
+
+# Back to back cycles would mostly be served from the response cache, so time every request
+no_cache_ttls = {'run_num': 0, 'rate': 0, 'latest_daq_file_name': 0, 'mvtx_mixed_staves': 0, 'batch': 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the DAQ Watch poll cycle, parsers and plot updates')
+    parser.add_argument('--cycles', type=int, default=200, help='Watch cycles per query mode for cycle latency')
+    parser.add_argument('--hours', type=float, default=1, help='Hours of 1 s cycles to run for memory growth')
+    parser.add_argument('--output', default=None, help='Write the JSON results to this file')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['cycle', 'parse', 'plot', 'memory'],
+                        help='Benchmarks to skip')
+    args = parser.parse_args()
+
+    # Sim in its own process, so its allocations and request handling aren't counted against the watcher
+    sim, sim_url = start_sim_process('steady')
+    results = {'time': time()}
+    try:
+        if 'cycle' not in args.skip:
+            results['cycle'] = bench_cycle(sim_url, args.cycles)
+        if 'parse' not in args.skip:
+            results['parse'] = bench_parse()
+        if 'plot' not in args.skip:
+            results['plot'] = bench_plot()
+        if 'memory' not in args.skip:
+            results['memory'] = bench_memory(sim_url, int(args.hours * 3600))
+    finally:
+        sim.terminate()
+        sim.wait()
+
+    print_results(results)
+    results_json = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(results_json)
+    else:
+        print(results_json)
+    print('donzo')
+
+
+def bench_cycle(grafana_url, cycles, modes=None):
+    """
+    Time complete check_daq cycles, all queries plus alarm evaluation, against a local GrafanaSim.
+    :param grafana_url: Url of the GrafanaSim.
+    :param cycles: Number of cycles per mode.
+    :param modes: Dictionary of mode name to DAQWatcher keyword arguments.
+    :return: Dictionary of mode name to latency percentiles in ms.
+    """
+    if modes is None:
+        modes = {
+            'range': {'rate_query_mode': 'range'},
+            'rate': {'rate_query_mode': 'rate'},
+            'incremental': {'rate_query_mode': 'incremental', 'mvtx_incremental': True},
+            'batch': {'rate_query_mode': 'rate', 'batch_queries': True, 'mvtx_incremental': True},
+        }
+    results = {}
+    for mode, kwargs in modes.items():
+        watcher = DAQWatcher(grafana_url=grafana_url, sound_backend=NullBackend(), cache_ttls=no_cache_ttls, **kwargs)
+        watcher.check_daq()  # Warm up connections
+        latencies = []
+        for i in range(cycles):
+            start = perf_counter()
+            watcher.check_daq()
+            latencies.append(perf_counter() - start)
+        results[mode] = get_percentiles(latencies)
+    return results
+
+
+def bench_parse(n_samples_list=(100, 1000, 10000, 100000), n_files_list=(10, 1000, 10000)):
+    """
+    Time full json decoding and parsing against targeted extraction (PrometheusExtract) of l1count range vector
+    responses of increasing length, as get_rate gets them, and of DAQ file size vectors with increasing numbers of
+    files, as get_latest_daq_file_name gets them.
+    :param n_samples_list: Numbers of samples in the synthetic range vector responses.
+    :param n_files_list: Numbers of files in the synthetic file size responses.
+    :return: List of result dictionaries, one per response.
+    """
+    watcher = DAQWatcher(sound_backend=NullBackend())
+    cases = [('range_vector', n, get_range_vector_body(n), watcher.parse_range_rate, extract_first_last_samples)
+             for n in n_samples_list]
+    cases += [('file_names', n, get_file_vector_body(n), watcher.parse_latest_daq_file_name, extract_first_filename)
+              for n in n_files_list]
+    results = []
+    for response, n, body, parser, extract in cases:
+        body = body.encode()
+        decode_times, parse_times, extract_times = [], [], []
+        for i in range(max(3, 100000 // n)):
+            start = perf_counter()
+            data = json.loads(body)
+            decoded = perf_counter()
+            full_result = parser(data)
+            parsed = perf_counter()
+            extract_result = parser(extract(body))
+            decode_times.append(decoded - start)
+            parse_times.append(parsed - decoded)
+            extract_times.append(perf_counter() - parsed)
+        assert extract_result == full_result
+        results.append({'response': response, 'n': n, 'payload_bytes': len(body),
+                        'decode_ms': get_percentiles(decode_times)['p50_ms'],
+                        'parse_ms': get_percentiles(parse_times)['p50_ms'],
+                        'extract_ms': get_percentiles(extract_times)['p50_ms'],
+                        'decode_peak_bytes': get_peak_memory(json.loads, body),
+                        'extract_peak_bytes': get_peak_memory(extract, body)})
+    return results
+
+
+def get_peak_memory(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def get_range_vector_body(n_samples, rate=3000, scrape_interval=2):
+    """
+    Synthetic /api/v1/query response of an l1count range vector.
+    """
+    start = time() - n_samples * scrape_interval
+    values = [[round(start + i * scrape_interval, 3), str(i * rate * scrape_interval)] for i in range(n_samples)]
+    return json.dumps({'status': 'success', 'data': {'resultType': 'matrix', 'result': [
+        {'metric': {'__name__': 'sphenix_gtm_gl1_json_dump_l1count', 'instance': 'gl1daq:9100', 'job': 'gl1'},
+         'values': values}]}})
+
+
+def get_file_vector_body(n_files):
+    """
+    Synthetic /api/v1/query response of the max by(run, filename, hostname) DAQ file size query.
+    """
+    now = time()
+    result = [{'metric': {'filename': f'/bbox/commissioning/GL1/physics/GL1_physics_gl1daq-{50000 - i:08d}-0000.prdf',
+                          'hostname': 'gl1daq', 'run': str(50000 - i)}, 'value': [now, str(2 ** 31)]}
+              for i in range(n_files)]
+    return json.dumps({'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
+
+
+class AggRatePlot:
+    """
+    The DAQWatchGUI rate plot on an Agg canvas, without Tk. Shares the GUI's update methods so the same code is timed.
+    """
+    update_plot = DAQWatchGUI.update_plot
+    on_plot_draw = DAQWatchGUI.on_plot_draw
+    get_plot_update_stats = DAQWatchGUI.get_plot_update_stats
+
+    def __init__(self, graph_points, max_graph_points=100000, plot_width=800, rate_threshold=2000):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        self.graph_points = graph_points
+        self.plot_width = plot_width  # pixels
+        self.rate_threshold = rate_threshold
+        self.rate_history = RateHistory(max_graph_points)
+        self.plot_decimator = MinMaxDecimator()
+        self.fig, self.ax = plt.subplots(figsize=(plot_width / 100, 3), dpi=100)
+        self.canvas = self.fig.canvas
+        self.line, = self.ax.plot([], [], 'r-', animated=True)
+        self.thresh_line = self.ax.axhline(self.rate_threshold / 1000, color='g', linestyle='--', animated=True)
+        self.canvas.mpl_connect('draw_event', self.on_plot_draw)
+        self.plot_background = None
+        self.plot_x_headroom = 0.2
+        self.blit_update_times = deque(maxlen=100)
+        self.full_draw_times = deque(maxlen=100)
+
+    def draw_rate_history(self, rescale_y=True):
+        """
+        As DAQWatchGUI.draw_rate_history with a fixed plot width.
+        """
+        y_top = None
+        if rescale_y and len(self.rate_history) > 0:
+            y_top = max(self.rate_history.max(), self.rate_threshold / 1000) * 1.1
+        times, rates = self.plot_decimator.decimate(self.rate_history, self.graph_points, self.plot_width // 2)
+        self.update_plot(times / 86400, rates, y_top)
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+
+
+def bench_plot(graph_points_list=(100, 500, 5000, 50000), updates=200):
+    """
+    Time the per-poll plot update of update_gui, appending a point and redrawing, against graph_points. The history
+    is filled first, so each update is in the steady state of a long running GUI.
+    :param graph_points_list: graph_points settings to test.
+    :param updates: Number of updates to time per setting.
+    :return: List of result dictionaries, one per graph_points.
+    """
+    results = []
+    for graph_points in graph_points_list:
+        plot = AggRatePlot(graph_points)
+        now = time()
+        n_fill = plot.rate_history.capacity
+        plot.rate_history.extend([now - n_fill + i for i in range(n_fill)], [3 + (i % 7) / 100 for i in range(n_fill)])
+        plot.draw_rate_history()
+        plot.blit_update_times.clear()
+        plot.full_draw_times.clear()
+        update_times = []
+        for i in range(updates):
+            start = perf_counter()
+            plot.rate_history.append(now + i, 3 + (i % 7) / 100)
+            plot.draw_rate_history()
+            update_times.append(perf_counter() - start)
+        stats = plot.get_plot_update_stats()
+        results.append({'graph_points': graph_points, **get_percentiles(update_times),
+                        'full_draws': len(plot.full_draw_times), 'blit_ms': stats['blit_ms'],
+                        'full_draw_ms': stats['full_draw_ms']})
+        plot.close()
+    return results
+
+
+def bench_memory(grafana_url, cycles, sample_every=600):
+    """
+    Run many watch cycles back to back as hours of 1 s polling, with the watcher's clock and the Prometheus query
+    time advanced 1 s per cycle, and track traced memory growth of the watcher and a rate history fed like the GUI's.
+    :param grafana_url: Url of the GrafanaSim, run in its own process so only this side is traced.
+    :param cycles: Number of cycles to run.
+    :param sample_every: Cycles between memory samples.
+    :return: Dictionary of memory samples and growth.
+    """
+    clock = FakeClock(time())
+    history = RateHistory(100000)
+    watcher = ClockedWatcher(clock, grafana_url=grafana_url, sound_backend=NullBackend(),
+                             rate_query_mode='incremental', cache_ttls=no_cache_ttls,
+                             update_callback=lambda snapshot: history.append(snapshot.time,
+                                                                             (snapshot.rate or 0) / 1000))
+    real_time, watcher_module.time = watcher_module.time, clock
+    try:
+        watcher.check_daq()
+        gc.collect()
+        tracemalloc.start()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        samples = []
+        for cycle in range(1, cycles + 1):
+            clock.advance(1)
+            watcher.check_daq()
+            if cycle % sample_every == 0 or cycle == cycles:
+                gc.collect()
+                samples.append({'cycle': cycle, 'traced_bytes': tracemalloc.get_traced_memory()[0] - start_bytes})
+        peak = tracemalloc.get_traced_memory()[1] - start_bytes
+        tracemalloc.stop()
+    finally:
+        watcher_module.time = real_time
+    growth = samples[-1]['traced_bytes'] if len(samples) > 0 else 0
+    return {'cycles': cycles, 'growth_bytes': growth, 'growth_bytes_per_1000_cycles': growth / max(cycles, 1) * 1000,
+            'peak_bytes': peak, 'samples': samples}
+
+
+class FakeClock:
+    def __init__(self, start):
+        """
+        Stand-in for time.time which only moves when advanced, to run hours of polling in minutes.
+        """
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class ClockedWatcher(DAQWatcher):
+    def __init__(self, clock, **kwargs):
+        """
+        DAQWatcher asking Prometheus for data at the time of clock, through the query API's time parameter, instead of
+        the real now.
+        """
+        self.clock = clock
+        super().__init__(**kwargs)
+
+    def request_data(self, params, name, url, extract=None):
+        return super().request_data({**params, 'time': self.clock()}, name, url, extract)
+
+
+def start_sim_process(scenario, timeout=10):
+    """
+    Start GrafanaSim as a subprocess on a free port and wait for it to answer.
+    :return: Popen of the sim, its url.
+    """
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+    sim_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GrafanaSim.py')
+    sim = subprocess.Popen([sys.executable, sim_path, '--port', str(port), '--scenario', scenario, '--seed', '0'],
+                           stdout=subprocess.DEVNULL)
+    url = f'http://localhost:{port}'
+    start = time()
+    while time() - start < timeout:
+        try:
+            requests.get(f'{url}/api/ds/query', timeout=1)
+            return sim, url
+        except requests.ConnectionError:
+            sleep(0.1)
+    sim.terminate()
+    raise RuntimeError(f'GrafanaSim did not start on port {port}')
+
+
+def get_percentiles(times):
+    times = sorted(times)
+    if len(times) == 0:
+        return {}
+
+    def percentile(p):
+        return times[min(int(p / 100 * len(times)), len(times) - 1)] * 1000
+
+    return {'n': len(times), 'p50_ms': percentile(50), 'p90_ms': percentile(90), 'p99_ms': percentile(99),
+            'max_ms': times[-1] * 1000}
+
+
+def print_results(results):
+    if 'cycle' in results:
+        print(f'{"Cycle mode":<12} {"p50 (ms)":>9} {"p90 (ms)":>9} {"p99 (ms)":>9} {"Max (ms)":>9}')
+        for mode, res in results['cycle'].items():
+            print(f'{mode:<12} {res["p50_ms"]:>9.2f} {res["p90_ms"]:>9.2f} {res["p99_ms"]:>9.2f} {res["max_ms"]:>9.2f}')
+    if 'parse' in results:
+        print(f'{"Response":<13} {"N":>7} {"Payload (B)":>12} {"Decode (ms)":>12} {"Parse (ms)":>11} '
+              f'{"Extract (ms)":>13} {"Decode peak (B)":>16} {"Extract peak (B)":>17}')
+        for res in results['parse']:
+            print(f'{res["response"]:<13} {res["n"]:>7} {res["payload_bytes"]:>12} {res["decode_ms"]:>12.3f} '
+                  f'{res["parse_ms"]:>11.4f} {res["extract_ms"]:>13.3f} {res["decode_peak_bytes"]:>16} '
+                  f'{res["extract_peak_bytes"]:>17}')
+    if 'plot' in results:
+        print(f'{"Graph pts":>9} {"p50 (ms)":>9} {"p99 (ms)":>9} {"Full draws":>11}')
+        for res in results['plot']:
+            print(f'{res["graph_points"]:>9} {res["p50_ms"]:>9.2f} {res["p99_ms"]:>9.2f} {res["full_draws"]:>11}')
+    if 'memory' in results:
+        res = results['memory']
+        print(f'Memory: {res["growth_bytes"]} B growth over {res["cycles"]} cycles, '
+              f'{res["growth_bytes_per_1000_cycles"]:.0f} B per 1000 cycles, peak {res["peak_bytes"]} B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on October 17 14:30 2026
+Created in PyCharm
+Created as sPHENIX_DAQ_Watch/headless
+
+@author: Dylan Neff, dn277127
+"""
+
+import os
+import sys
+import json
+import signal
+import logging
+import argparse
+from time import time
+
+from DAQWatcher import DAQWatcher
+from SoundPlayer import NullBackend
+
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+log = logging.getLogger('daq_watch')
+
+
+def main():
+    """
+    Run DAQWatcher without Tk or matplotlib, logging every cycle as a JSON line. For running as a service on the DAQ
+    hosts. SIGTERM/SIGINT stop the watcher cleanly, SIGHUP reloads the config file.
+    :return:
+    """
+    start = time()
+    parser = argparse.ArgumentParser(description='Headless sPHENIX DAQ Watch')
+    parser.add_argument('local', nargs='?', default=None, help="'local' or 'l' to use the forwarded ssh port")
+    parser.add_argument('--config', default=os.path.join(repo_dir, 'config.json'), help='Path to config file')
+    parser.add_argument('--grafana-url', default=None, help='Grafana url, overrides local')
+    parser.add_argument('--no-sound', action='store_true', help="Don't play alarm sounds")
+    parser.add_argument('--log-file', default=None, help='Log to this file instead of stdout')
+    parser.add_argument('--publish', default=None, metavar='HOST:PORT',
+                        help='Share readings with subscribing watchers on this address')
+    parser.add_argument('--subscribe', default=None, metavar='HOST:PORT',
+                        help='Take readings from the publishing watcher at this address instead of polling')
+    args = parser.parse_args()
+
+    handler = logging.FileHandler(args.log_file) if args.log_file else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    # On the root logger so DAQWatcher's and the other modules' errors come out as JSON records too
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.grafana_url is not None:
+        grafana_url = args.grafana_url
+    elif args.local is not None and args.local.lower() in ['local', 'l', '1']:
+        grafana_url = 'http://localhost:7815'  # For running through forwarded ssh port
+    else:
+        grafana_url = 'http://insight.sphenix.bnl.gov:3000'
+
+    config = read_config(args.config)
+    if args.publish is not None:
+        config['publish_address'] = args.publish
+    if args.subscribe is not None:
+        config['subscribe_address'] = args.subscribe
+    watcher = DAQWatcher(update_callback=log_snapshot, grafana_url=grafana_url,
+                         sound_backend=NullBackend() if args.no_sound else None, **get_watcher_kwargs(config))
+    apply_config(watcher, config)
+
+    def stop(signum, frame):
+        log.info('stopping', extra={'fields': {'signal': signal.Signals(signum).name}})
+        watcher.stop()
+
+    def reload(signum, frame):
+        apply_config(watcher, read_config(args.config))
+        log.info('config reloaded', extra={'fields': {'config': args.config}})
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload)
+
+    log.info('started', extra={'fields': {'grafana_url': grafana_url, 'startup_time': time() - start}})
+    watcher.watch_daq()
+    log.info('stopped')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry)
+
+
+def log_snapshot(snapshot):
+    log.info('snapshot', extra={'fields': snapshot._asdict()})
+
+
+def read_config(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        log.warning('no config file found', extra={'fields': {'config': path}})
+        return {}
+
+
+def get_watcher_kwargs(config):
+    """
+    Convert config file values, saved as strings by the GUI, to DAQWatcher constructor arguments. Missing or empty
+    values are left at the DAQWatcher defaults.
+    :param config: Dictionary from config.json
+    :return: Dictionary of DAQWatcher keyword arguments
+    """
+    conversions = {'rate_threshold': float, 'integration_time': int, 'check_time': float, 'target_run_time': float,
+                   'rate_alarm_cushion': int, 'new_run_cushion': float, 'connect_timeout': float,
+                   'read_timeout': float, 'request_retries': int, 'retry_backoff': float, 'rate_query_mode': str,
+                   'batch_queries': bool, 'mvtx_incremental': bool, 'mvtx_resync_period': float, 'metrics_port': int,
+                   'publish_address': str, 'subscribe_address': str, 'cache_ttls': dict,
+                   'adaptive_polling': bool, 'min_check_time': float, 'idle_check_time': float,
+                   'stable_check_time': float, 'run_poll_time': float, 'run_start_lookback': int, 'archive_days': int}
+    kwargs = {key: convert(config[key]) for key, convert in conversions.items()
+              if config.get(key) is not None and config.get(key) != ''}
+    if config.get('archive_dir') is not None:
+        kwargs['archive_dir'] = os.path.join(repo_dir, config['archive_dir'])
+    return kwargs
+
+
+def apply_config(watcher, config):
+    """
+    Set the config values which can change while the watcher is running.
+    :param watcher: DAQWatcher
+    :param config: Dictionary from config.json
+    :return:
+    """
+    kwargs = get_watcher_kwargs(config)
+    for key in ['rate_threshold', 'integration_time', 'check_time', 'target_run_time', 'rate_alarm_cushion',
+                'new_run_cushion']:
+        if key in kwargs:
+            setattr(watcher, key, kwargs[key])
+    watcher.run_time_reminder = bool(config.get('run_time_reminder', watcher.run_time_reminder))
+    watcher.mvtx_alerts = bool(config.get('mvtx_staves_alarm', watcher.mvtx_alerts))
+    for config_key, attribute in [('alarm_sound_file', 'alert_sound_file'),
+                                  ('run_end_reminder_sound_file', 'run_end_sound_file'),
+                                  ('run_start_sound_file', 'run_start_sound_file'),
+                                  ('mvtx_staves_alarm_sound_file', 'mvtx_alert_sound_file')]:
+        if config.get(config_key) is not None:
+            setattr(watcher, attribute, config[config_key])
+
+
+if __name__ == '__main__':
+    main()
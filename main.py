@@ -8,25 +8,88 @@ Created as sPHENIX_DAQ_Watch/main
 @author: Dylan Neff, dn277127
 """
 
-import sys
-import tkinter as tk
+from time import perf_counter
+start_time = perf_counter()  # Before any other imports, for --profile-startup
 
-from DAQWatchGUI import DAQWatchGUI
+import sys
 
 
 def main():
-    local = False
-    if len(sys.argv) > 2:
+    local, profile_startup = False, False
+    args = sys.argv[1:]
+    if '--profile-startup' in args:
+        profile_startup = True
+        args.remove('--profile-startup')
+    try:
+        publish_address = pop_option(args, '--publish')
+        subscribe_address = pop_option(args, '--subscribe')
+    except ValueError as e:
+        print(e)
+        return
+    if len(args) > 1:
         print('Too many arguments.')
         return
-    elif len(sys.argv) == 2:
-        if sys.argv[1].lower() == 'local' or sys.argv[1].lower() == 'l' or sys.argv[1] == 1:
+    elif len(args) == 1:
+        if args[0].lower() == 'local' or args[0].lower() == 'l' or args[0] == '1':
             local = True
+
+    profiler = StartupProfiler(start_time, print_report=profile_startup)
+    import tkinter as tk
+    profiler.mark('tkinter imported')
+    from DAQWatchGUI import DAQWatchGUI
+    profiler.mark('DAQWatchGUI imported')
+
     root = tk.Tk()
-    app = DAQWatchGUI(root, local)
+    profiler.mark('Tk created')
+    app = DAQWatchGUI(root, local, startup_mark=profiler.mark, publish_address=publish_address,
+                      subscribe_address=subscribe_address)
     root.mainloop()
     print('donzo')
 
 
+def pop_option(args, name):
+    """
+    Remove an option and its value from args.
+    :return: Value of the option, None if not given.
+    """
+    if name not in args:
+        return None
+    index = args.index(name)
+    if index + 1 >= len(args):
+        raise ValueError(f'{name} needs a HOST:PORT value.')
+    value = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+class StartupProfiler:
+    def __init__(self, start, print_report=False, final_marks=('plot created', 'first poll displayed')):
+        """
+        Record the time of each startup step and print a breakdown once all final_marks have been reached.
+        :param start: perf_counter time the process started.
+        :param print_report: Print the report, else only record.
+        :param final_marks: Marks which must all be reached before the report is printed.
+        """
+        self.start = start
+        self.print_report = print_report
+        self.final_marks = set(final_marks)
+        self.marks = []  # (name, perf_counter time)
+        self.reported = False
+
+    def mark(self, name):
+        self.marks.append((name, perf_counter()))
+        if self.print_report and not self.reported and self.final_marks <= {mark for mark, t in self.marks}:
+            self.reported = True
+            print(self.get_report())
+
+    def get_report(self):
+        lines = ['Startup profile:', f'  {"Step":<28} {"Step (ms)":>10} {"Total (ms)":>11}']
+        last = self.start
+        for name, t in self.marks:
+            lines.append(f'  {name:<28} {(t - last) * 1000:>10.1f} {(t - self.start) * 1000:>11.1f}')
+            last = t
+        return '\n'.join(lines)
+
+
 if __name__ == '__main__':
     main()